@@ -1,106 +1,48 @@
 import os
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, AsyncIterator, Iterator
 import logging
 from datetime import datetime
 import sys
+import asyncio
+import threading
+import time
+import re
+import io
+import hashlib
+from collections import deque
+from operator import itemgetter
+from cachetools import TTLCache
+import numpy as np
+import orjson
+import pandas as pd
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from google.api_core import exceptions as google_exceptions
 
-# Debug information (To resolve the Docker issues I was getting on my system please ignore these fallbacks...)
-print(f"[AI_ENGINE] Python executable: {sys.executable}")
-print(f"[AI_ENGINE] Current working directory: {os.getcwd()}")
-print(f"[AI_ENGINE] PYTHONPATH: {os.environ.get('PYTHONPATH', 'Not set')}")
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-GENAI_AVAILABLE = False
-genai = None
-types = None
+# Interpreter/environment details for diagnosing container setups, only built when debugging
+if logger.isEnabledFor(logging.DEBUG):
+    logger.debug("[AI_ENGINE] Python executable: %s", sys.executable)
+    logger.debug("[AI_ENGINE] Current working directory: %s", os.getcwd())
+    logger.debug("[AI_ENGINE] PYTHONPATH: %s", os.environ.get('PYTHONPATH', 'Not set'))
 
-def try_install_package():
-    """Try to install google-generativeai if not available"""
-    try:
-        import subprocess
-        print("[AI_ENGINE] Attempting to install google-generativeai...")
-        result = subprocess.run([
-            sys.executable, "-m", "pip", "install", "--no-cache-dir", "google-generativeai==0.8.4"
-        ], capture_output=True, text=True, timeout=60)
-        
-        if result.returncode == 0:
-            print("[AI_ENGINE] ✅ google-generativeai installed successfully")
-            return True
-        else:
-            print(f"[AI_ENGINE] ❌ Installation failed: {result.stderr}")
-            return False
-    except Exception as e:
-        print(f"[AI_ENGINE] ❌ Installation error: {e}")
-        return False
-
-def import_with_retry():
-    """Try importing with multiple strategies"""
-    global genai, types, GENAI_AVAILABLE
-    
-    strategies = [
-        # Strategy 1: Direct import
-        lambda: __import__('google.generativeai', fromlist=['generativeai']),
-        
-        # Strategy 2: Try after sys.path modification
-        lambda: (
-            sys.path.insert(0, '/usr/local/lib/python3.12/site-packages'),
-            __import__('google.generativeai', fromlist=['generativeai'])
-        )[1],
-        
-        # Strategy 3: Try after pip install
-        lambda: (
-            try_install_package(),
-            __import__('google.generativeai', fromlist=['generativeai'])
-        )[1] if try_install_package() else None
-    ]
-    
-    for i, strategy in enumerate(strategies):
-        try:
-            print(f"[AI_ENGINE] Trying import strategy {i+1}...")
-            genai = strategy()
-            if genai:
-                print(f"[AI_ENGINE] ✅ Strategy {i+1} successful!")
-                
-                # Try to import types
-                try:
-                    from google.genai import types
-                    print("[AI_ENGINE] ✅ google.genai.types imported")
-                except ImportError:
-                    try:
-                        types = __import__('google.generativeai.types', fromlist=['types'])
-                        print("[AI_ENGINE] ✅ google.generativeai.types imported as fallback")
-                    except ImportError:
-                        print("[AI_ENGINE] ⚠️ types module not available, using None")
-                        types = None
-                
-                GENAI_AVAILABLE = True
-                return True
-                
-        except Exception as e:
-            print(f"[AI_ENGINE] ❌ Strategy {i+1} failed: {e}")
-            continue
-    
-    return False
-
-# Try the import with retry mechanism
 try:
-    print("[AI_ENGINE] Starting import process...")
-    import_success = import_with_retry()
-    
-    if not import_success:
-        print("[AI_ENGINE] ❌ All import strategies failed")
-        GENAI_AVAILABLE = False
-    
-except Exception as e:
-    print(f"[AI_ENGINE] ❌ Critical import error: {e}")
-    import traceback
-    traceback.print_exc()
+    import google.generativeai as genai
+    from google.generativeai import types
+    GENAI_AVAILABLE = True
+    logger.debug("[AI_ENGINE] google.generativeai imported")
+except ImportError as e:
+    logger.warning("[AI_ENGINE] google.generativeai import failed: %s", e)
+    genai = None
+    types = None
     GENAI_AVAILABLE = False
 
 # Import other dependencies
 try:
     from vector_store import PortfolioVectorStore
 except ImportError as e:
-    print(f"[AI_ENGINE] ⚠️ vector_store import failed: {e}")
+    logger.warning("[AI_ENGINE] vector_store import failed: %s", e)
     # Create a dummy vector store
     class DummyVectorStore:
         def add_portfolio_data(self, data): pass
@@ -108,19 +50,169 @@ except ImportError as e:
         def get_stats(self): return {}
     PortfolioVectorStore = DummyVectorStore
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Transient Gemini failures (429 and 5xx) worth retrying
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+# System instructions are module constants so every request shares a byte-identical
+# prefix (system instruction + portfolio data), which is what Gemini's implicit cache matches on
+ANALYSIS_SYSTEM_INSTRUCTION = """You are a senior portfolio manager and investment advisor specializing in sovereign fund management.
+Analyze the provided portfolio data and provide insights on:
+1. Overall portfolio health and performance
+2. Risk assessment and management
+3. Sector allocation and diversification
+4. Performance vs benchmarks
+5. Key strengths and areas for improvement
+
+Be precise, data-driven, and provide actionable insights."""
+
+RECOMMENDATIONS_SYSTEM_INSTRUCTION = """You are an expert investment advisor for sovereign wealth funds.
+Generate specific, actionable investment recommendations based on the portfolio analysis.
+Focus on: optimization opportunities, risk management, diversification improvements,
+and performance enhancement strategies."""
+
+CHAT_SYSTEM_INSTRUCTION = """You are a knowledgeable portfolio advisor with access to detailed portfolio data.
+Answer questions about the portfolio using the specific data provided. Be detailed, specific, and use actual numbers
+from the data. Do not give generic responses - always reference the actual portfolio holdings, performance metrics,
+and risk data provided in the context."""
+
+# Row templates for the holdings tables in the portfolio summary, built once at import
+_HOLDING_ROW_FMT = (
+    "{:2d}. {:<35} | Ticker: {:<15} | Sector: {:<20} | Weight: {:>6.2%} "
+    "| Market Value: ₹{:>15,.0f} | Price: ₹{:>8.2f} | ESG: {:<4} | Dividend: {:>5.2%}\n"
+).format
+_TOP_HOLDING_ROW_FMT = (
+    "{:2d}. {:<30} ({:<12}) Sector: {:<20} Weight: {:.2%} Value: ₹{:,.0f} ESG: {}\n"
+).format
+
+# Columns of a holdings row, in _HOLDING_ROW_FMT order, with the default for a missing column
+_HOLDING_COLUMN_DEFAULTS = {
+    'Asset_Name': 'Unknown',
+    'Ticker_Symbol': 'N/A',
+    'Sector': 'Unknown',
+    'Weight_Percent': 0,
+    'Market_Value': 0,
+    'Current_Price': 0,
+    'ESG_Rating': 'N/A',
+    'Dividend_Yield': 0,
+}
+
+_HOLDING_COLUMN_SET = frozenset(_HOLDING_COLUMN_DEFAULTS)
+_HOLDING_ROW = itemgetter(*_HOLDING_COLUMN_DEFAULTS)
+_MARKET_VALUE_KEY = itemgetter('Market_Value')
+_ITEM_VALUE_KEY = itemgetter(1)
+
+# Numbered recommendation header ("1. Title") and priority line in AI output; the level may
+# come before or after the word ("High Priority", "Priority level: high")
+_NUM_RE = re.compile(r'^\s*(\d+)\.\s*(.*)$')
+_PRIORITY_RE = re.compile(r'priority', re.I)
+_PRIORITY_LEVEL_RE = re.compile(r'\b(high|medium|low)\b', re.I)
+
+# End marker the recommendations prompt asks for; also sent as the stop sequence. Not "---":
+# markdown output uses that as a separator between recommendations
+RECOMMENDATIONS_END = "<<END_RECOMMENDATIONS>>"
+
+# Separates the static prompt prefix from the per-call tail
+STATIC_CONTEXT_END = "=== END OF PORTFOLIO DATA ==="
+
+_RETRY_DELAY_RE = re.compile(r'retry[_ ]?delay\W+(?:seconds\W+)?(\d+(?:\.\d+)?)', re.IGNORECASE)
+_backoff = wait_random_exponential(min=1, max=30)
+
+def _retry_wait(retry_state) -> float:
+    """Prefer the server-provided retryDelay of a 429, fall back to jittered exponential backoff"""
+    error = retry_state.outcome.exception()
+    
+    for detail in getattr(error, 'details', None) or []:
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None and (delay.seconds or delay.nanos):
+            return delay.seconds + delay.nanos / 1e9
+    
+    match = _RETRY_DELAY_RE.search(str(error))
+    if match:
+        return float(match.group(1))
+    
+    return _backoff(retry_state)
+
+# Canonical JSON for fingerprints: key order and NumPy scalars must not change the digest
+_FINGERPRINT_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _fingerprint_default(value):
+    """orjson fallback for the non-JSON values in processed_data"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        try:
+            # Vectorized row hashing instead of walking cells in Python
+            rows = pd.util.hash_pandas_object(value, index=False).to_numpy()
+        except TypeError:
+            # Unhashable cells (e.g. lists): serialize the frame itself
+            return value.to_dict('split')
+        columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+        return [[str(column) for column in columns], hashlib.blake2b(rows.tobytes(), digest_size=16).hexdigest()]
+    if isinstance(value, np.ndarray):
+        # Non-contiguous arrays are not serialized natively
+        return value.tolist()
+    return str(value)
 
 class PortfolioAIEngine:
     """AI Engine for portfolio analysis and recommendations using Gemini LLM"""
     
+    # Background event loop shared by every engine in the process: the SDK's async client
+    # (and its connection pool) is process-wide and stays bound to the loop that first used it
+    _loop = None
+    _loop_lock = threading.Lock()
+    # In-flight request cap shared by every engine (sessions spend one quota), created on that loop
+    _sem = None
+    # Rolling 60s RPM/TPM windows per API key, each as ([timestamp, token_count] deque, lock)
+    _rate_windows = {}
+    # Gemini context caches are billed server-side objects, so one table serves every engine;
+    # created with its lock on that loop, see _context_cache_state
+    _context_caches = None
+    _context_cache_lock = None
+    
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         self.client = None
-        self.vector_store = PortfolioVectorStore()
-        self.chat_history = []
+        self._vs = None  # built on first use, see vector_store
+        self._indexed_fingerprint = None  # fingerprint of the last processed_data added to the store
+        # Only the last few turns feed the prompt; older ones are evicted automatically
+        self.chat_history = deque(maxlen=int(os.getenv('CHAT_HISTORY_MAX', '20')))
+        # Already formatted "role: message" lines of the last turns, as used in the chat prompt
+        self._history_tail: deque = deque(maxlen=4)
+        
+        # Cap in-flight Gemini requests so concurrent callers don't trip the quota (429s)
+        self.max_concurrency = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+        
+        # Client-side pacing against the per-minute request/token quotas (0 disables a limit)
+        self.rpm_limit = int(os.getenv('GEMINI_RPM_LIMIT', '15'))
+        self.tpm_limit = int(os.getenv('GEMINI_TPM_LIMIT', '250000'))
+        
+        # One pinned model version for plain and cached calls: context caching needs an explicit
+        # version, and an alias would let cached and uncached answers come from different models
+        self.model_name = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash-001')
+        
+        # Explicit Gemini context caches for the static system instruction + portfolio summary;
+        # entries expire slightly before the server-side TTL so they are refreshed in time
+        self.cache_ttl = int(os.getenv('GEMINI_CACHE_TTL', '600'))
+        # Gemini 1.5 models reject caches under 32768 tokens; later models accept far smaller ones
+        default_min_tokens = '32768' if '1.5' in self.model_name else '4096'
+        self.cache_min_tokens = int(os.getenv('GEMINI_CACHE_MIN_TOKENS', default_min_tokens))
+        self.context_cache_size = int(os.getenv('GEMINI_CONTEXT_CACHE_SIZE', '16'))
         
-        print(f"[AI_ENGINE] Initializing with GENAI_AVAILABLE={GENAI_AVAILABLE}")
+        # Rendered portfolio summaries keyed by processed_data fingerprint
+        self._summary_cache = TTLCache(maxsize=16, ttl=300)
+        
+        # Recent responses keyed by (system instruction, data fingerprint, prompt, generation settings), e.g. repeated "Refresh" clicks
+        self._resp_cache = TTLCache(
+            maxsize=int(os.getenv('GEMINI_RESPONSE_CACHE_SIZE', '256')),
+            ttl=int(os.getenv('GEMINI_RESPONSE_CACHE_TTL', '900'))
+        )
+        
+        # Last healthcheck() outcome as (monotonic timestamp, healthy)
+        self.healthcheck_ttl = int(os.getenv('GEMINI_HEALTHCHECK_TTL', '60'))
+        self._health = None
         
         # Initialize Gemini client - REQUIRED, no fallbacks
         if not GENAI_AVAILABLE:
@@ -130,48 +222,106 @@ class PortfolioAIEngine:
             raise ValueError("GEMINI_API_KEY environment variable not set. Please set your Gemini API key.")
         
         try:
-            print("[AI_ENGINE] Configuring Gemini client...")
+            logger.debug("[AI_ENGINE] Configuring Gemini client...")
             genai.configure(api_key=self.api_key)
-            self.client = genai.GenerativeModel('gemini-1.5-flash')
+            self.client = genai.GenerativeModel(self.model_name)
             logger.info("Gemini AI client initialized successfully")
             
-            # Test the client with a simple call
-            print("[AI_ENGINE] Testing Gemini client...")
-            test_response = self.client.generate_content("Test")
-            logger.info(f"Gemini client test successful: {test_response.text}")
-            print("[AI_ENGINE] ✅ Gemini client fully operational")
-            
         except Exception as e:
             logger.error(f"Failed to initialize Gemini client: {str(e)}")
-            print(f"[AI_ENGINE] ❌ Gemini client initialization failed: {e}")
             raise RuntimeError(f"Cannot initialize Gemini AI: {str(e)}")
+        
+        # The API round-trip is opt-in at startup; otherwise call healthcheck() on demand
+        if os.getenv('GEMINI_STARTUP_PROBE') == '1' and not self.healthcheck():
+            raise RuntimeError("Cannot initialize Gemini AI: startup health check failed")
+    
+    def healthcheck(self) -> bool:
+        """Probe the Gemini API with a minimal request; the result is cached for GEMINI_HEALTHCHECK_TTL seconds"""
+        now = time.monotonic()
+        if self._health is not None and now - self._health[0] < self.healthcheck_ttl:
+            return self._health[1]
+        
+        try:
+            test_text = self._run_sync(self._aprobe())
+            logger.info(f"Gemini client test successful: {test_text}")
+            healthy = True
+        except Exception as e:
+            logger.warning(f"Gemini health check failed: {str(e)}")
+            healthy = False
+        
+        self._health = (now, healthy)
+        return healthy
+    
+    async def _aprobe(self) -> str:
+        """Single un-retried "Test" request, still paced by the rate limiter and semaphore"""
+        await self._enforce_rate_limits(1)
+        async with self._semaphore():
+            response = await self.client.generate_content_async("Test")
+        return response.text
+    
+    @property
+    def vector_store(self) -> PortfolioVectorStore:
+        """Vector store, created lazily so callers that never need retrieval don't pay for it"""
+        if self._vs is None:
+            self._vs = PortfolioVectorStore()
+        return self._vs
     
     def analyze_portfolio(self, processed_data: Dict[str, Any]) -> Dict[str, Any]:
         """Comprehensive portfolio analysis using AI"""
+        return self._run_sync(self.aanalyze_portfolio(processed_data))
+    
+    def generate_recommendations(self, processed_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Generate AI-powered investment recommendations"""
+        return self._run_sync(self.agenerate_recommendations(processed_data))
+    
+    def analyze_and_recommend(self, processed_data: Dict[str, Any], refresh: bool = False) -> tuple:
+        """Run portfolio analysis and recommendations concurrently, returns (analysis, recommendations).
+        With refresh=True both are regenerated instead of served from the response cache"""
+        return self._run_sync(self.aanalyze_and_recommend(processed_data, refresh))
+    
+    def chat_with_portfolio(self, user_message: str, processed_data: Dict[str, Any]) -> str:
+        """Interactive chat about portfolio data"""
+        return self._run_sync(self.achat_with_portfolio(user_message, processed_data))
+    
+    def stream_chat(self, user_message: str, processed_data: Dict[str, Any]) -> Iterator[str]:
+        """Blocking iterator over astream_chat's chunks, e.g. for st.write_stream"""
+        agen = self.astream_chat(user_message, processed_data)
         try:
-            # Add data to vector store for context
+            while True:
+                try:
+                    yield self._run_sync(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Consumer stopped early: let the async side close its Gemini stream
+            self._run_sync(agen.aclose())
+    
+    def index_snapshot(self, processed_data: Dict[str, Any], fingerprint: Optional[str] = None):
+        """Add processed_data to the vector store for context, unless this exact snapshot is already indexed.
+        Callers that reuse a cached analysis call this so the store still sees the snapshot"""
+        if fingerprint is None:
+            fingerprint = self._fingerprint(processed_data)
+        if fingerprint != self._indexed_fingerprint:
             self.vector_store.add_portfolio_data(processed_data)
+            self._indexed_fingerprint = fingerprint
+    
+    async def aanalyze_portfolio(self, processed_data: Dict[str, Any], refresh: bool = False) -> Dict[str, Any]:
+        """Async version of analyze_portfolio"""
+        try:
+            # Add data to vector store for context
+            fingerprint = self._fingerprint(processed_data)  # one hash keys every cache layer below
+            self.index_snapshot(processed_data, fingerprint)
             
             # Prepare analysis prompt
-            portfolio_summary = self._prepare_portfolio_summary(processed_data)
+            portfolio_summary = self._prepare_portfolio_summary(processed_data, fingerprint)
             
-            system_instruction = """You are a senior portfolio manager and investment advisor specializing in sovereign fund management. 
-            Analyze the provided portfolio data and provide insights on:
-            1. Overall portfolio health and performance
-            2. Risk assessment and management
-            3. Sector allocation and diversification
-            4. Performance vs benchmarks
-            5. Key strengths and areas for improvement
-            
-            Be precise, data-driven, and provide actionable insights."""
-            
-            prompt = f"""Please analyze this sovereign fund portfolio:
-
-{portfolio_summary}
+            prompt = """Please analyze the sovereign fund portfolio above.
 
 Provide a comprehensive analysis covering performance, risk, diversification, and overall portfolio health."""
             
-            analysis = self._generate_content(prompt, system_instruction)
+            analysis = await self._agenerate_content(prompt, ANALYSIS_SYSTEM_INSTRUCTION, context=portfolio_summary,
+                                                context_key=fingerprint, max_output_tokens=2048,
+                                                refresh=refresh)
             
             return {
                 'analysis': analysis,
@@ -183,20 +333,15 @@ Provide a comprehensive analysis covering performance, risk, diversification, an
             logger.error(f"Error in portfolio analysis: {str(e)}")
             raise RuntimeError(f"Portfolio analysis failed: {str(e)}")
     
-    def generate_recommendations(self, processed_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Generate AI-powered investment recommendations"""
+    async def agenerate_recommendations(self, processed_data: Dict[str, Any],
+                                        refresh: bool = False) -> List[Dict[str, Any]]:
+        """Async version of generate_recommendations"""
         try:
-            portfolio_summary = self._prepare_portfolio_summary(processed_data)
+            fingerprint = self._fingerprint(processed_data)
+            portfolio_summary = self._prepare_portfolio_summary(processed_data, fingerprint)
             context = self.vector_store.get_context_for_query("investment recommendations", processed_data)
             
-            system_instruction = """You are an expert investment advisor for sovereign wealth funds. 
-            Generate specific, actionable investment recommendations based on the portfolio analysis.
-            Focus on: optimization opportunities, risk management, diversification improvements, 
-            and performance enhancement strategies."""
-            
-            prompt = f"""Based on this portfolio data and context:
-
-{portfolio_summary}
+            prompt = f"""Based on the portfolio data above and this context:
 
 Context from similar periods:
 {context}
@@ -207,9 +352,14 @@ Generate 5-7 specific investment recommendations with:
 - Implementation priority (High/Medium/Low)
 - Risk considerations
 
-Format as numbered recommendations."""
-            
-            recommendations_text = self._generate_content(prompt, system_instruction)
+Format as numbered recommendations. After the last recommendation, write a line containing only {RECOMMENDATIONS_END}"""
+            
+            # The end marker doubles as a stop sequence, so closing commentary is never generated
+            recommendations_text = await self._agenerate_content(prompt, RECOMMENDATIONS_SYSTEM_INSTRUCTION,
+                                                           context=portfolio_summary, context_key=fingerprint,
+                                                           max_output_tokens=1536,
+                                                           stop_sequences=(RECOMMENDATIONS_END,),
+                                                           refresh=refresh)
             recommendations = self._parse_recommendations(recommendations_text)
             
             return recommendations
@@ -218,11 +368,24 @@ Format as numbered recommendations."""
             logger.error(f"Error generating recommendations: {str(e)}")
             raise RuntimeError(f"Recommendation generation failed: {str(e)}")
     
-    def chat_with_portfolio(self, user_message: str, processed_data: Dict[str, Any]) -> str:
-        """Interactive chat about portfolio data"""
+    async def aanalyze_and_recommend(self, processed_data: Dict[str, Any], refresh: bool = False) -> tuple:
+        """Async version of analyze_and_recommend"""
+        return await asyncio.gather(
+            self.aanalyze_portfolio(processed_data, refresh),
+            self.agenerate_recommendations(processed_data, refresh)
+        )
+    
+    async def achat_with_portfolio(self, user_message: str, processed_data: Dict[str, Any]) -> str:
+        """Async version of chat_with_portfolio"""
+        return "".join([chunk async for chunk in self.astream_chat(user_message, processed_data)])
+    
+    async def astream_chat(self, user_message: str, processed_data: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream the chat answer as Gemini produces it; the full reply is added to history at the end"""
         try:
             # Get relevant context from vector store
             context = self.vector_store.get_context_for_query(user_message, processed_data)
+            fingerprint = self._fingerprint(processed_data)
+            portfolio_summary = self._prepare_portfolio_summary(processed_data, fingerprint)
             
             # Add to chat history
             self.chat_history.append({
@@ -230,18 +393,14 @@ Format as numbered recommendations."""
                 'message': user_message,
                 'timestamp': datetime.now().isoformat()
             })
+            self._history_tail.append(f"user: {user_message}")
             
-            system_instruction = """You are a knowledgeable portfolio advisor with access to detailed portfolio data. 
-            Answer questions about the portfolio using the specific data provided. Be detailed, specific, and use actual numbers 
-            from the data. Do not give generic responses - always reference the actual portfolio holdings, performance metrics, 
-            and risk data provided in the context."""
-            
-            # Build conversation context with recent history
-            recent_history = self.chat_history[-5:]  # Last 5 messages
-            history_text = "\n".join([f"{msg['role']}: {msg['message']}" for msg in recent_history[-4:]])
+            # Build conversation context with recent history (last 4 pre-formatted lines)
+            history_text = "\n".join(self._history_tail)
             
-            # Create comprehensive prompt with all available data
-            prompt = f"""COMPLETE PORTFOLIO CONTEXT:
+            # Create comprehensive prompt with all available data; the full portfolio
+            # summary goes in the (cacheable) context, query-specific context here
+            prompt = f"""RELEVANT CONTEXT:
 {context}
 
 RECENT CONVERSATION:
@@ -252,9 +411,14 @@ CURRENT USER QUESTION: {user_message}
 Please provide a detailed, specific answer using the actual portfolio data above. Include specific company names, 
 exact percentages, and real numbers from the data. Do not give generic responses."""
             
-            # Generate content with Gemini
+            # Stream content from Gemini
             logger.info(f"Calling Gemini API for chat query: {user_message[:50]}...")
-            response = self._generate_content(prompt, system_instruction)
+            chunks = []
+            async for chunk in self._astream_content(prompt, CHAT_SYSTEM_INSTRUCTION, context=portfolio_summary,
+                                                  context_key=fingerprint, max_output_tokens=768):
+                chunks.append(chunk)
+                yield chunk
+            response = "".join(chunks)
             logger.info("Gemini API call successful")
             
             # Add response to history
@@ -263,152 +427,444 @@ exact percentages, and real numbers from the data. Do not give generic responses
                 'message': response,
                 'timestamp': datetime.now().isoformat()
             })
-            
-            return response
+            self._history_tail.append(f"assistant: {response}")
             
         except Exception as e:
             logger.error(f"Error in chat: {str(e)}")
             raise RuntimeError(f"AI chat failed: {str(e)}")
     
-    def _generate_content(self, prompt: str, system_instruction: str, temperature: float = 0.3) -> str:
-        """Generate content using Gemini API"""
-        try:
-            # Create full prompt with system instruction
-            full_prompt = f"{system_instruction}\n\n{prompt}"
+    def _run_sync(self, coro):
+        """Run a coroutine on the shared background event loop and block until it completes"""
+        cls = type(self)
+        with cls._loop_lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                threading.Thread(target=cls._loop.run_forever, name="ai-engine-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, cls._loop).result()
+    
+    def _semaphore(self) -> asyncio.Semaphore:
+        """Process-wide GEMINI_MAX_CONCURRENCY semaphore; only called from the shared loop"""
+        cls = type(self)
+        if cls._sem is None:
+            cls._sem = asyncio.Semaphore(self.max_concurrency)
+        return cls._sem
+    
+    def _rate_state(self) -> tuple:
+        """Process-wide (window, lock) of this engine's API key; only called from the shared loop"""
+        state = type(self)._rate_windows.get(self.api_key)
+        if state is None:
+            state = type(self)._rate_windows[self.api_key] = (deque(), asyncio.Lock())
+        return state
+    
+    def _context_cache_state(self) -> tuple:
+        """Process-wide (table, lock) of context caches; only called from the shared loop"""
+        cls = type(self)
+        if cls._context_caches is None:
+            cls._context_caches = TTLCache(  # (api key, model, system_instruction, context key) -> {'cached_content', 'model'}
+                maxsize=self.context_cache_size,
+                ttl=max(self.cache_ttl - 30, 1)
+            )
+            cls._context_cache_lock = asyncio.Lock()
+        return cls._context_caches, cls._context_cache_lock
+    
+    def _shared_context_cache_key(self, system_instruction: str, context: str, context_key: Any) -> tuple:
+        # Caches belong to the API key's project and are bound to one model
+        return (self.api_key, self.model_name) + self._context_cache_key(system_instruction, context, context_key)
+    
+    def _build_full_prompt(self, system_instruction: str, prompt: str, context: Optional[str] = None) -> str:
+        """Assemble static parts first (system instruction, portfolio data) and the varying prompt last"""
+        # Strip trailing whitespace per line so the static prefix stays byte-identical across calls
+        parts = [system_instruction.strip()]
+        if context:
+            parts.append("\n".join(line.rstrip() for line in context.strip().split("\n")))
+            parts.append(STATIC_CONTEXT_END)
+        parts.append(prompt.strip())
+        return "\n\n".join(parts)
+    
+    async def _aget_cached_model(self, system_instruction: str, context: str, context_key: Any = None):
+        """Return a model bound to an explicit context cache of (system_instruction, context), or None"""
+        # Gemini rejects caches below its minimum token count (~4 chars per token)
+        if (len(system_instruction) + len(context)) // 4 < self.cache_min_tokens:
+            return None
+        
+        key = self._shared_context_cache_key(system_instruction, context, context_key)
+        table, lock = self._context_cache_state()
+        async with lock:
+            entry = table.get(key)
+            if entry:
+                return entry['model']
             
-            # Handle different generation config approaches
             try:
-                if types and hasattr(types, 'GenerationConfig'):
-                    generation_config = types.GenerationConfig(
-                        temperature=temperature,
-                        max_output_tokens=2000,
+                # Creating a cache is a paced request too: it takes a rate-window slot for the
+                # cached tokens and a semaphore slot like any generation
+                await self._enforce_rate_limits((len(system_instruction) + len(context)) // 4)
+                async with self._semaphore():
+                    cached_content = await asyncio.to_thread(
+                        genai.caching.CachedContent.create,
+                        model=f"models/{self.model_name}",
+                        system_instruction=system_instruction,
+                        contents=[context],
+                        ttl=self.cache_ttl,
                     )
-                else:
-                    # Fallback for different versions
-                    generation_config = {
-                        'temperature': temperature,
-                        'max_output_tokens': 2000,
-                    }
+                model = genai.GenerativeModel.from_cached_content(cached_content)
+                logger.info(f"Created Gemini context cache {cached_content.name}")
+            except Exception as e:
+                # Remember the failure for one TTL so we don't retry creation on every call
+                logger.warning(f"Gemini context caching unavailable, sending full prompts: {str(e)}")
+                cached_content, model = None, None
+            
+            table[key] = {
+                'cached_content': cached_content,
+                'model': model
+            }
+            return model
+    
+    async def _enforce_rate_limits(self, estimated_tokens: int) -> list:
+        """Wait until a request fits in the rolling 60s RPM/TPM window, then reserve a slot for it"""
+        window, lock = self._rate_state()
+        async with lock:
+            while True:
+                now = time.monotonic()
+                while window and now - window[0][0] >= 60:
+                    window.popleft()
+                
+                used_tokens = sum(entry[1] for entry in window)
+                rpm_ok = not self.rpm_limit or len(window) < self.rpm_limit
+                # An empty window always admits the request, even if it alone exceeds the TPM limit
+                tpm_ok = not self.tpm_limit or not window or used_tokens + estimated_tokens <= self.tpm_limit
+                if rpm_ok and tpm_ok:
+                    break
                 
-                response = self.client.generate_content(
-                    full_prompt,
-                    generation_config=generation_config
-                )
-            except Exception as config_error:
-                print(f"[AI_ENGINE] Config error, using basic generation: {config_error}")
-                response = self.client.generate_content(full_prompt)
+                wait = window[0][0] + 60 - now
+                logger.info(f"Gemini rate limit reached, waiting {wait:.1f}s")
+                await asyncio.sleep(wait)
             
-            return response.text
+            entry = [now, estimated_tokens]
+            window.append(entry)
+            return entry
+    
+    def _generate_content(self, prompt: str, system_instruction: str, temperature: float = 0.3,
+                          max_output_tokens: int = 1024) -> str:
+        """Generate content using Gemini API"""
+        return self._run_sync(self._agenerate_content(prompt, system_instruction, temperature,
+                                                      max_output_tokens=max_output_tokens))
+    
+    def _build_generation_config(self, temperature: float, max_output_tokens: int = 1024,
+                                 stop_sequences: tuple = ()):
+        """Build the generation config for the installed SDK version"""
+        config = {
+            'temperature': temperature,
+            'max_output_tokens': max_output_tokens,
+        }
+        if stop_sequences:
+            config['stop_sequences'] = list(stop_sequences)
+        
+        if types and hasattr(types, 'GenerationConfig'):
+            return types.GenerationConfig(**config)
+        # Fallback for different versions
+        return config
+    
+    async def _agenerate_content(self, prompt: str, system_instruction: str, temperature: float = 0.3,
+                                 context: Optional[str] = None, context_key: Any = None,
+                                 max_output_tokens: int = 1024, stop_sequences: tuple = (),
+                                 refresh: bool = False) -> str:
+        """Generate content using the async Gemini API.
+        
+        `context` is the static portfolio data shared across calls; when it is large enough
+        it is served from an explicit Gemini context cache instead of being re-sent.
+        `context_key` (the processed_data fingerprint) identifies `context` in the response
+        and context caches so the summary text itself never has to be hashed.
+        `max_output_tokens` is sized per call site; `stop_sequences` lets a prompt that asks
+        for an end marker finish as soon as the model emits it. `refresh` skips the
+        response cache lookup; the new answer replaces the cached one.
+        """
+        try:
+            # (temperature, max_output_tokens, stop_sequences) for _build_generation_config
+            generation = (temperature, max_output_tokens, tuple(stop_sequences))
+            
+            # Identical prompt + context + generation settings → reuse the previous answer
+            cache_key = self._response_cache_key(system_instruction, prompt, context, context_key, generation)
+            cached_text = None if refresh else self._resp_cache.get(cache_key)
+            if cached_text is not None:
+                logger.info("Gemini response served from cache")
+                return cached_text
+            
+            response = await self._aopen_response(prompt, system_instruction, generation, context, context_key)
+            text = response.text
+            
+            self._resp_cache[cache_key] = text
+            return text
             
         except Exception as e:
             logger.error(f"Error generating content with Gemini: {str(e)}")
             raise
     
-    def _prepare_portfolio_summary(self, data: Dict[str, Any]) -> str:
-        """Prepare comprehensive portfolio summary for AI analysis"""
-        summary_parts = []
+    async def _astream_content(self, prompt: str, system_instruction: str, temperature: float = 0.3,
+                               context: Optional[str] = None, context_key: Any = None,
+                               max_output_tokens: int = 1024, stop_sequences: tuple = ()) -> AsyncIterator[str]:
+        """Streaming counterpart of _agenerate_content: yields text chunks as Gemini emits them"""
+        try:
+            generation = (temperature, max_output_tokens, tuple(stop_sequences))
+            cache_key = self._response_cache_key(system_instruction, prompt, context, context_key, generation)
+            cached_text = self._resp_cache.get(cache_key)
+            if cached_text is not None:
+                logger.info("Gemini response served from cache")
+                yield cached_text
+                return
+            
+            response = await self._aopen_response(prompt, system_instruction, generation, context, context_key,
+                                                  stream=True)
+            chunks = []
+            try:
+                async for chunk in response:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+            finally:
+                # Runs on early close too, so the stream's semaphore slot is always released
+                await response.aclose()
+            
+            # Only complete answers are cached
+            self._resp_cache[cache_key] = "".join(chunks)
+            
+        except Exception as e:
+            logger.error(f"Error streaming content from Gemini: {str(e)}")
+            raise
+    
+    def _context_cache_key(self, system_instruction: str, context: str, context_key: Any) -> tuple:
+        return (system_instruction, context if context_key is None else context_key)
+    
+    def _response_cache_key(self, system_instruction: str, prompt: str, context: Optional[str],
+                            context_key: Any, generation: tuple) -> tuple:
+        # Plain tuple key: strings cache their own hash, so no digest over the full prompt is needed
+        return self._context_cache_key(system_instruction, context, context_key) + (prompt, generation)
+    
+    async def _aopen_response(self, prompt: str, system_instruction: str, generation: tuple,
+                              context: Optional[str], context_key: Any = None, stream: bool = False):
+        """Send the request through the context cache when possible, else with the full prompt"""
+        if context:
+            cached_model = await self._aget_cached_model(system_instruction, context, context_key)
+            if cached_model is not None:
+                try:
+                    response = await self._acall_gemini(cached_model, prompt, generation, stream=stream)
+                    # Streams report usage once consumed, so only whole responses are logged here
+                    usage = getattr(response, 'usage_metadata', None)
+                    if usage is not None:
+                        logger.info(f"Gemini cached tokens: {getattr(usage, 'cached_content_token_count', 0)}")
+                    return response
+                except google_exceptions.NotFound:
+                    # Cache expired server-side; drop it and send the full prompt
+                    logger.info("Gemini context cache expired, falling back to full prompt")
+                    table, _ = self._context_cache_state()
+                    table.pop(self._shared_context_cache_key(system_instruction, context, context_key), None)
+        
+        full_prompt = self._build_full_prompt(system_instruction, prompt, context)
+        return await self._acall_gemini(self.client, full_prompt, generation, stream=stream)
+    
+    @retry(
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        wait=_retry_wait,
+        stop=stop_after_attempt(5),
+        reraise=True,
+    )
+    async def _acall_gemini(self, model, full_prompt: str, generation: tuple, stream: bool = False):
+        """Single paced Gemini request on `model`, retried on 429/5xx.
+        
+        With `stream=True` this returns once the first chunk has arrived, so retries
+        only cover opening the stream. The stream's semaphore slot is held until the
+        returned iterator is exhausted or closed, see _ahold_stream.
+        """
+        # Rough pre-call estimate (~4 chars per token), reconciled with actual usage below
+        rate_entry = await self._enforce_rate_limits(len(full_prompt) // 4)
+        
+        if not stream:
+            async with self._semaphore():
+                response = await self._asend(model, full_prompt, generation)
+            self._record_usage(rate_entry, response)
+            return response
+        
+        await self._semaphore().acquire()
+        try:
+            response = await self._asend(model, full_prompt, generation, stream=True)
+        except BaseException:
+            self._semaphore().release()
+            raise
+        return self._ahold_stream(response, rate_entry)
+    
+    async def _asend(self, model, full_prompt: str, generation: tuple, stream: bool = False):
+        """generate_content_async with the generation config, retrying without it if the SDK rejects it"""
+        # Handle different generation config approaches
+        try:
+            return await model.generate_content_async(
+                full_prompt,
+                generation_config=self._build_generation_config(*generation),
+                stream=stream
+            )
+        except RETRYABLE_ERRORS + (google_exceptions.NotFound,):
+            raise
+        except Exception as config_error:
+            logger.debug("[AI_ENGINE] Config error, using basic generation: %s", config_error)
+            return await model.generate_content_async(full_prompt, stream=stream)
+    
+    async def _ahold_stream(self, response, rate_entry: list) -> AsyncIterator[Any]:
+        """Yield the chunks of an open stream; its generation counts against the semaphore
+        until the body is consumed, and its usage is reconciled once the stream ends"""
+        try:
+            async for chunk in response:
+                yield chunk
+        finally:
+            self._semaphore().release()
+            self._record_usage(rate_entry, response)
+    
+    def _record_usage(self, rate_entry: list, response):
+        """Replace the rate-window token estimate with the response's actual usage, when reported"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None and getattr(usage, 'total_token_count', None):
+            rate_entry[1] = usage.total_token_count
+    
+    def _fingerprint(self, data: Dict[str, Any]) -> str:
+        """Stable content hash of processed_data (hex digest), used as the cache key of every layer"""
+        payload = orjson.dumps(data, default=_fingerprint_default, option=_FINGERPRINT_OPTIONS)
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+    
+    def _prepare_portfolio_summary(self, data: Dict[str, Any], fingerprint: Optional[str] = None) -> str:
+        """Prepare comprehensive portfolio summary for AI analysis, memoized on the data fingerprint"""
+        if fingerprint is None:
+            fingerprint = self._fingerprint(data)
+        summary = self._summary_cache.get(fingerprint)
+        if summary is None:
+            summary = self._build_portfolio_summary(data)
+            self._summary_cache[fingerprint] = summary
+        return summary
+    
+    def _build_portfolio_summary(self, data: Dict[str, Any]) -> str:
+        """Render the portfolio summary text sent to the model"""
+        buf = io.StringIO()
+        write = buf.write
         
         # Portfolio overview
         if 'portfolio_summary' in data:
             portfolio = data['portfolio_summary']
-            summary_parts.append("PORTFOLIO OVERVIEW:")
-            summary_parts.append(f"Fund: {portfolio.get('fund_name', 'Unknown')}")
-            summary_parts.append(f"AUM: {portfolio.get('total_aum', 0):,.0f} {portfolio.get('base_currency', 'INR')}")
-            summary_parts.append(f"Holdings: {portfolio.get('total_holdings', 0)}")
-            summary_parts.append(f"Target Return: {portfolio.get('target_return', 0):.1%}")
-            summary_parts.append(f"Risk Level: {portfolio.get('risk_level', 'Unknown')}")
-            summary_parts.append("")
+            write("PORTFOLIO OVERVIEW:\n")
+            write(f"Fund: {portfolio.get('fund_name', 'Unknown')}\n")
+            write(f"AUM: {portfolio.get('total_aum', 0):,.0f} {portfolio.get('base_currency', 'INR')}\n")
+            write(f"Holdings: {portfolio.get('total_holdings', 0)}\n")
+            write(f"Target Return: {portfolio.get('target_return', 0):.1%}\n")
+            write(f"Risk Level: {portfolio.get('risk_level', 'Unknown')}\n\n")
         
         # Performance metrics
         if 'performance_summary' in data:
             perf = data['performance_summary']
-            summary_parts.append("PERFORMANCE METRICS:")
-            summary_parts.append(f"Current Value: {perf.get('current_value', 0):,.0f}")
-            summary_parts.append(f"Total Return: {perf.get('total_return', 0):.2%}")
-            summary_parts.append(f"Daily Return: {perf.get('daily_return', 0):.2%}")
-            summary_parts.append(f"Volatility: {perf.get('volatility', 0):.2%}")
-            summary_parts.append(f"Sharpe Ratio: {perf.get('sharpe_ratio', 0):.2f}")
-            summary_parts.append(f"Max Drawdown: {perf.get('max_drawdown', 0):.2%}")
-            summary_parts.append(f"Active Return: {perf.get('active_return', 0):.2%}")
-            summary_parts.append("")
+            write("PERFORMANCE METRICS:\n")
+            write(f"Current Value: {perf.get('current_value', 0):,.0f}\n")
+            write(f"Total Return: {perf.get('total_return', 0):.2%}\n")
+            write(f"Daily Return: {perf.get('daily_return', 0):.2%}\n")
+            write(f"Volatility: {perf.get('volatility', 0):.2%}\n")
+            write(f"Sharpe Ratio: {perf.get('sharpe_ratio', 0):.2f}\n")
+            write(f"Max Drawdown: {perf.get('max_drawdown', 0):.2%}\n")
+            write(f"Active Return: {perf.get('active_return', 0):.2%}\n\n")
         
         # Risk metrics
         if 'risk_summary' in data:
             risk = data['risk_summary']
-            summary_parts.append("RISK METRICS:")
-            summary_parts.append(f"Portfolio Beta: {risk.get('portfolio_beta', 0):.2f}")
-            summary_parts.append(f"VaR (95%): {risk.get('var_95', 0):,.0f}")
-            summary_parts.append(f"CVaR (95%): {risk.get('cvar_95', 0):,.0f}")
-            summary_parts.append(f"Tracking Error: {risk.get('tracking_error', 0):.3f}")
-            summary_parts.append(f"Correlation with Benchmark: {risk.get('correlation_benchmark', 0):.3f}")
-            summary_parts.append(f"Concentration Risk: {risk.get('concentration_risk', 0):.3f}")
-            summary_parts.append(f"Liquidity Score: {risk.get('liquidity_score', 0):.1f}")
-            summary_parts.append("")
+            write("RISK METRICS:\n")
+            write(f"Portfolio Beta: {risk.get('portfolio_beta', 0):.2f}\n")
+            write(f"VaR (95%): {risk.get('var_95', 0):,.0f}\n")
+            write(f"CVaR (95%): {risk.get('cvar_95', 0):,.0f}\n")
+            write(f"Tracking Error: {risk.get('tracking_error', 0):.3f}\n")
+            write(f"Correlation with Benchmark: {risk.get('correlation_benchmark', 0):.3f}\n")
+            write(f"Concentration Risk: {risk.get('concentration_risk', 0):.3f}\n")
+            write(f"Liquidity Score: {risk.get('liquidity_score', 0):.1f}\n\n")
         
         # COMPLETE HOLDINGS DATA - Enhanced with all details
-        if 'raw_holdings_df' in data and data['raw_holdings_df']:
-            holdings_list = data['raw_holdings_df']
-            summary_parts.append("COMPLETE HOLDINGS DETAILS:")
-            summary_parts.append(f"Total Holdings: {len(holdings_list)}")
-            summary_parts.append("All Holdings with Full Details:")
+        holdings_list = data.get('raw_holdings_df')
+        if isinstance(holdings_list, pd.DataFrame) and not holdings_list.empty:
+            # The payload may carry only the largest holdings; the total comes from the overview
+            total_holdings = max(data.get('portfolio_summary', {}).get('total_holdings', 0), len(holdings_list))
+            if len(holdings_list) < total_holdings:
+                write("LARGEST HOLDINGS DETAILS:\n")
+                write(f"Total Holdings: {total_holdings}\n")
+                write(f"Top {len(holdings_list)} Holdings by Market Value with Full Details:\n")
+            else:
+                write("COMPLETE HOLDINGS DETAILS:\n")
+                write(f"Total Holdings: {len(holdings_list)}\n")
+                write("All Holdings with Full Details:\n")
+            
+            # Sort and project columns in pandas, then format plain row tuples
+            holdings_view = holdings_list
+            if 'Market_Value' in holdings_view:
+                holdings_view = holdings_view.sort_values('Market_Value', ascending=False, kind='stable')
+            holdings_view = holdings_view.reindex(columns=list(_HOLDING_COLUMN_DEFAULTS)).fillna(
+                {col: default for col, default in _HOLDING_COLUMN_DEFAULTS.items() if col not in holdings_list}
+            )
+            for i, row in enumerate(holdings_view.itertuples(index=False, name=None), 1):
+                write(_HOLDING_ROW_FMT(i, *row))
+            write("\n")
+            
+        elif holdings_list:
+            write("COMPLETE HOLDINGS DETAILS:\n")
+            write(f"Total Holdings: {len(holdings_list)}\n")
+            write("All Holdings with Full Details:\n")
+            
+            # DataFrame records carry every column; only rows missing some get the defaults merged in,
+            # so the loop below is a single itemgetter call per holding
+            if not all(_HOLDING_COLUMN_SET <= holding.keys() for holding in holdings_list):
+                holdings_list = [{**_HOLDING_COLUMN_DEFAULTS, **holding} for holding in holdings_list]
             
             # Sort by market value descending
-            sorted_holdings = sorted(holdings_list, key=lambda x: x.get('Market_Value', 0), reverse=True)
-            
-            for i, holding in enumerate(sorted_holdings):
-                summary_parts.append(
-                    f"{i+1:2d}. {holding.get('Asset_Name', 'Unknown'):<35} "
-                    f"| Ticker: {holding.get('Ticker_Symbol', 'N/A'):<15} "
-                    f"| Sector: {holding.get('Sector', 'Unknown'):<20} "
-                    f"| Weight: {holding.get('Weight_Percent', 0):>6.2%} "
-                    f"| Market Value: ₹{holding.get('Market_Value', 0):>15,.0f} "
-                    f"| Price: ₹{holding.get('Current_Price', 0):>8.2f} "
-                    f"| ESG: {holding.get('ESG_Rating', 'N/A'):<4} "
-                    f"| Dividend: {holding.get('Dividend_Yield', 0):>5.2%}"
-                )
-            summary_parts.append("")
+            sorted_holdings = sorted(holdings_list, key=_MARKET_VALUE_KEY, reverse=True)
+            
+            for i, holding in enumerate(sorted_holdings, 1):
+                write(_HOLDING_ROW_FMT(i, *_HOLDING_ROW(holding)))
+            write("\n")
             
         elif 'top_holdings' in data and data['top_holdings']:
             # Fallback to top holdings if raw data not available
-            summary_parts.append("TOP HOLDINGS:")
-            summary_parts.append(f"Showing Top {len(data['top_holdings'])} Holdings:")
-            for i, holding in enumerate(data['top_holdings']):
-                summary_parts.append(
-                    f"{i+1:2d}. {holding.get('Asset_Name', 'Unknown'):<30} "
-                    f"({holding.get('Ticker_Symbol', 'N/A'):<12}) "
-                    f"Sector: {holding.get('Sector', 'Unknown'):<20} "
-                    f"Weight: {holding.get('Weight_Percent', 0):.2%} "
-                    f"Value: ₹{holding.get('Market_Value', 0):,.0f} "
-                    f"ESG: {holding.get('ESG_Rating', 'N/A')}"
-                )
-            summary_parts.append("")
+            write("TOP HOLDINGS:\n")
+            write(f"Showing Top {len(data['top_holdings'])} Holdings:\n")
+            for i, holding in enumerate(data['top_holdings'], 1):
+                write(_TOP_HOLDING_ROW_FMT(
+                    i,
+                    holding.get('Asset_Name', 'Unknown'),
+                    holding.get('Ticker_Symbol', 'N/A'),
+                    holding.get('Sector', 'Unknown'),
+                    holding.get('Weight_Percent', 0),
+                    holding.get('Market_Value', 0),
+                    holding.get('ESG_Rating', 'N/A')
+                ))
+            write("\n")
         
         # SECTOR ALLOCATION - Enhanced
         if 'sector_allocation' in data and data['sector_allocation']:
-            summary_parts.append("SECTOR ALLOCATION:")
+            write("SECTOR ALLOCATION:\n")
             total_value = sum(data['sector_allocation'].values())
-            sorted_sectors = sorted(data['sector_allocation'].items(), key=lambda x: x[1], reverse=True)
+            sorted_sectors = sorted(data['sector_allocation'].items(), key=_ITEM_VALUE_KEY, reverse=True)
+            sector_counts = data.get('holdings_data', {}).get('sector_counts', {})
             for sector, value in sorted_sectors:
                 weight = value / total_value if total_value > 0 else 0
-                summary_parts.append(f"- {sector:<25}: {weight:.1%} ({value:,.0f} INR)")
-            summary_parts.append("")
+                count = sector_counts.get(sector)
+                held = f", {count} holdings" if count is not None else ""
+                write(f"- {sector:<25}: {weight:.1%} ({value:,.0f} INR{held})\n")
+            write("\n")
         
-        # GEOGRAPHIC ALLOCATION - If available
-        if 'holdings_data' in data and 'geographic_allocation' in data['holdings_data']:
-            geo_data = data['holdings_data']['geographic_allocation']
-            summary_parts.append("GEOGRAPHIC ALLOCATION:")
-            for geo, value in geo_data.items():
-                summary_parts.append(f"- {geo}: {value}")
-            summary_parts.append("")
+        # GEOGRAPHIC ALLOCATION - If available, formatted like the sector lines
+        geo_data = data.get('holdings_data', {}).get('geographic_allocation')
+        if geo_data:
+            write("GEOGRAPHIC ALLOCATION:\n")
+            total_value = sum(geo_data.values())
+            for geo, value in sorted(geo_data.items(), key=_ITEM_VALUE_KEY, reverse=True):
+                weight = value / total_value if total_value > 0 else 0
+                write(f"- {geo:<25}: {weight:.1%} ({value:,.0f} INR)\n")
+            write("\n")
         
-        return "\n".join(summary_parts)
+        return buf.getvalue()
     
     def _parse_recommendations(self, recommendations_text: str) -> List[Dict[str, Any]]:
         """Parse AI-generated recommendations into structured format"""
         recommendations = []
         
         try:
-            lines = recommendations_text.split('\n')
+            # The stop sequence normally keeps the marker out; drop it and anything after if it got through
+            lines = recommendations_text.split(RECOMMENDATIONS_END, 1)[0].split('\n')
             current_rec = {}
             
             for line in lines:
@@ -417,39 +873,38 @@ exact percentages, and real numbers from the data. Do not give generic responses
                     continue
                 
                 # Check if it's a numbered recommendation
-                if line[0].isdigit() and '.' in line[:3]:
+                numbered = _NUM_RE.match(line)
+                if numbered:
                     # Save previous recommendation
                     if current_rec:
                         recommendations.append(current_rec)
                     
                     # Start new recommendation
-                    title = line.split('.', 1)[1].strip()
+                    title = numbered.group(2).strip()
                     current_rec = {
                         'title': title,
-                        'description': '',
+                        '_lines': [],
                         'priority': 'Medium',
-                        'rationale': '',
                         'impact': ''
                     }
                 elif current_rec:
                     # Add to description
-                    if 'priority' in line.lower():
-                        if 'high' in line.lower():
-                            current_rec['priority'] = 'High'
-                        elif 'low' in line.lower():
-                            current_rec['priority'] = 'Low'
+                    if _PRIORITY_RE.search(line):
+                        level = _PRIORITY_LEVEL_RE.search(line)
+                        if level:
+                            current_rec['priority'] = level.group(1).capitalize()
                     else:
-                        current_rec['description'] += ' ' + line
-                        current_rec['rationale'] += ' ' + line
+                        current_rec['_lines'].append(line)
             
             # Add last recommendation
             if current_rec:
                 recommendations.append(current_rec)
             
-            # Clean up descriptions
+            # Join the accumulated lines once; description and rationale share the same text
             for rec in recommendations:
-                rec['description'] = rec['description'].strip()
-                rec['rationale'] = rec['rationale'].strip()
+                text = ' '.join(rec.pop('_lines')).strip()
+                rec['description'] = text
+                rec['rationale'] = text
                 if not rec['description']:
                     rec['description'] = rec['title']
                 if not rec['rationale']:
@@ -473,11 +928,12 @@ exact percentages, and real numbers from the data. Do not give generic responses
     
     def get_chat_history(self) -> List[Dict[str, Any]]:
         """Get chat history"""
-        return self.chat_history
+        return list(self.chat_history)
     
     def clear_chat_history(self):
         """Clear chat history"""
-        self.chat_history = []
+        self.chat_history.clear()
+        self._history_tail.clear()
         logger.info("Chat history cleared")
     
     def get_vector_stats(self) -> Dict[str, Any]:
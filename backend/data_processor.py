@@ -1,41 +1,179 @@
+import io
+import os
+import glob
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional, Union, IO
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# python-calamine (Rust) parses xlsx several times faster than openpyxl; openpyxl stays the fallback
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    logger.info("python-calamine not installed, reading Excel files with openpyxl")
+    EXCEL_ENGINE = 'openpyxl'
+
+# Column types per sheet, applied by the Excel parser so cells are converted once at read time.
+# Portfolio weights fit float32; market values and portfolio levels in the billions keep float64,
+# since float32 would already be off by hundreds of rupees in the formatted output
+SHEET_DTYPES = {
+    'Portfolio_Overview': {'Total_AUM': 'int64', 'Target_Return': 'float64'},
+    'Holdings_Detail': {
+        'Market_Value': 'float64', 'Units_Held': 'int64', 'Average_Cost': 'float64',
+        'Current_Price': 'float64', 'Weight_Percent': 'float32', 'Dividend_Yield': 'float64'
+    },
+    'Historical_Performance': {
+        'Portfolio_Value': 'float64', 'Daily_Return': 'float64', 'Cumulative_Return': 'float64',
+        'Benchmark_Return': 'float64', 'Active_Return': 'float64', 'Volatility': 'float64',
+        'Sharpe_Ratio': 'float64', 'Max_Drawdown': 'float64', 'Turnover_Rate': 'float64'
+    },
+    'Benchmarks': {
+        'Primary_Benchmark': 'float64', 'Equity_Benchmark': 'float64', 'Bond_Benchmark': 'float64',
+        'Real_Estate_Benchmark': 'float64', 'Commodity_Benchmark': 'float64', 'Inflation_Rate': 'float64',
+        'Risk_Free_Rate': 'float64'
+    },
+    'Risk_Metrics': {
+        'Portfolio_Beta': 'float64', 'VaR_95': 'float64', 'CVaR_95': 'float64', 'Tracking_Error': 'float64',
+        'Information_Ratio': 'float64', 'Correlation_Benchmark': 'float64', 'Concentration_Risk': 'float64',
+        'Currency_Risk': 'float64', 'Liquidity_Score': 'float64'
+    },
+    'Cash_Flows': {'Amount': 'float64', 'FX_Rate': 'float64', 'Net_Cash_Flow': 'float64'},
+    'Market_Data': {
+        'SP500_Index': 'float64', 'VIX_Level': 'float64', 'USD_Index': 'float64', 'Oil_Price': 'float64',
+        'Gold_Price': 'float64', 'Bond_Yield_10Y': 'float64', 'LIBOR_3M': 'float64', 'GDP_Growth': 'float64'
+    },
+}
+
+# Row layout of the DETAILED HOLDINGS block in prepare_data_for_ai
+_TOP_HOLDING_LINE_FMT = (
+    "{:2d}. {:<35} | Ticker: {:<15} | Sector: {:<20} | Weight: {:>6.2%} | Value: ₹{:>15,.0f} | ESG: {:<3}\n"
+).format
+
+# Section headers of the prepare_data_for_ai text
+_OVERVIEW_HEADER = "=== PORTFOLIO OVERVIEW ===\n"
+_PERFORMANCE_HEADER = "=== PERFORMANCE METRICS ===\n"
+_RISK_HEADER = "=== RISK METRICS ===\n"
+_SECTOR_HEADER = "=== SECTOR ALLOCATION ===\n"
+
+# Date columns per sheet, parsed by read_excel instead of a separate to_datetime pass
+SHEET_DATES = {
+    'Portfolio_Overview': ['Inception_Date', 'Last_Updated'],
+    'Holdings_Detail': ['Purchase_Date'],
+    'Historical_Performance': ['Date'],
+    'Benchmarks': ['Date'],
+    'Risk_Metrics': ['Date'],
+    'Cash_Flows': ['Date'],
+    'Market_Data': ['Date'],
+}
+
+# Workbooks at least this large are parsed one sheet per thread; below it, reopening the file
+# in every thread costs more than the overlap saves
+PARALLEL_PARSE_MIN_BYTES = int(os.getenv('PARALLEL_PARSE_MIN_BYTES', 5 * 1024 * 1024))
+
+# Bumped whenever _clean_data changes what it stores, so older Parquet caches are not reused
+PARQUET_CACHE_VERSION = 2
+
+# Holdings rows sent to the model; sector totals and counts cover the rest of the book
+AI_HOLDINGS_LIMIT = int(os.getenv('AI_HOLDINGS_LIMIT', '20'))
+
+# Columns and display formats of the dashboard's Holdings Detail table
+HOLDINGS_TABLE_COLUMNS = [
+    'Asset_Name', 'Ticker_Symbol', 'Sector', 'Weight_Percent',
+    'Market_Value', 'Current_Price', 'ESG_Rating', 'Dividend_Yield'
+]
+HOLDINGS_TABLE_FORMATS = {
+    'Weight_Percent': '{:.2%}',
+    'Market_Value': '₹{:,.0f}',
+    'Current_Price': '₹{:.2f}',
+    'Dividend_Yield': '{:.2%}'
+}
+
+def _category_totals(labels: pd.Series, values: Optional[np.ndarray] = None):
+    """Per-label (names, value sums, row counts) over the labels that occur, in category order.
+    One np.bincount over the categorical codes: missing labels are dropped and missing values
+    count as 0, as in groupby().sum()"""
+    if not isinstance(labels.dtype, pd.CategoricalDtype):
+        labels = labels.astype('category')
+    codes = labels.cat.codes.to_numpy()
+    present = codes >= 0
+    codes = codes[present]
+    n_categories = len(labels.cat.categories)
+    counts = np.bincount(codes, minlength=n_categories)
+    sums = (np.bincount(codes, weights=np.nan_to_num(values[present]), minlength=n_categories)
+            if values is not None else None)
+    observed = np.flatnonzero(counts)
+    return labels.cat.categories[observed], None if sums is None else sums[observed], counts[observed]
+
 class PortfolioDataProcessor:
     """Handles Excel file processing and portfolio data management"""
     
     def __init__(self):
         self.data = {}
         self.processed_data = {}
+        # prepare_data_for_ai output for the current processed_data; _calculate_metrics resets it
+        self._ai_summary_cache: Optional[str] = None
         
-    def load_excel_file(self, file_path: str) -> Dict[str, pd.DataFrame]:
-        """Load and parse the multi-sheet Excel file"""
+    def load_excel_file(self, file_path: Union[str, os.PathLike, IO[bytes]]) -> Dict[str, pd.DataFrame]:
+        """Load and parse the multi-sheet Excel file, given as a path or an in-memory buffer"""
         try:
-            # Read all sheets
-            excel_data = pd.read_excel(file_path, sheet_name=None)
+            # Cleaned sheets from an earlier load of this exact file (same mtime and size);
+            # buffers such as uploads have no such identity and are always parsed
+            is_path = isinstance(file_path, (str, os.PathLike))
+            cache_dir = None
+            if is_path:
+                cache_dir = (f"{file_path}.{os.path.getmtime(file_path)}.{os.path.getsize(file_path)}"
+                             f".v{PARQUET_CACHE_VERSION}.parquet_dir")
+            cached_data = self._load_parquet_cache(cache_dir) if cache_dir else None
+            if cached_data is not None:
+                self.data = cached_data
+                logger.info(f"Loaded {len(cached_data)} sheets from Parquet cache")
+                self._calculate_metrics()
+                return self.data
             
-            # Expected sheet names
-            expected_sheets = [
-                'Portfolio_Overview', 'Holdings_Detail', 'Historical_Performance',
-                'Benchmarks', 'Risk_Metrics', 'Cash_Flows', 'Market_Data'
-            ]
+            # Open the workbook once and parse each sheet with its dtypes
+            with pd.ExcelFile(file_path, engine=EXCEL_ENGINE) as workbook:
+                # Expected sheet names
+                expected_sheets = [
+                    'Portfolio_Overview', 'Holdings_Detail', 'Historical_Performance',
+                    'Benchmarks', 'Risk_Metrics', 'Cash_Flows', 'Market_Data'
+                ]
+                
+                # Validate sheets exist
+                for sheet in expected_sheets:
+                    if sheet not in workbook.sheet_names:
+                        raise ValueError(f"Missing required sheet: {sheet}")
+                
+                sheet_names = workbook.sheet_names
+                # Parallel workers reopen the workbook, from the path or from the bytes of an in-memory buffer
+                source = file_path if is_path else (file_path.getvalue() if isinstance(file_path, io.BytesIO) else None)
+                size = os.path.getsize(file_path) if is_path else len(source or b'')
+                parallel = source is not None and (os.cpu_count() or 1) > 1 and size >= PARALLEL_PARSE_MIN_BYTES
+                if not parallel:
+                    excel_data = {name: self._read_sheet(workbook, name) for name in sheet_names}
             
-            # Validate sheets exist
-            for sheet in expected_sheets:
-                if sheet not in excel_data:
-                    raise ValueError(f"Missing required sheet: {sheet}")
+            if parallel:
+                # Parse the sheets concurrently, each thread through its own workbook handle
+                # (neither engine's workbook object is safe to share between threads)
+                with ThreadPoolExecutor(max_workers=min(8, len(sheet_names))) as executor:
+                    futures = {executor.submit(self._read_sheet_from_file, source, name): name
+                               for name in sheet_names}
+                    parsed = {futures[future]: future.result() for future in as_completed(futures)}
+                excel_data = {name: parsed[name] for name in sheet_names}
             
             self.data = excel_data
             logger.info(f"Successfully loaded {len(excel_data)} sheets")
             
             # Process and clean data
             self._clean_data()
+            if cache_dir:
+                self._write_parquet_cache(file_path, cache_dir)
             self._calculate_metrics()
             
             return self.data
@@ -44,42 +182,110 @@ class PortfolioDataProcessor:
             logger.error(f"Error loading Excel file: {str(e)}")
             raise
     
+    def load_sheets(self, data: Dict[str, pd.DataFrame], processed_data: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+        """Adopt the sheets and metrics of an earlier load_excel_file (e.g. a cached result) without recomputing"""
+        self.data = data
+        self.processed_data = processed_data
+        self._ai_summary_cache = None
+        return self.data
+    
+    def _load_parquet_cache(self, cache_dir: str) -> Dict[str, pd.DataFrame]:
+        """Read cleaned sheets written by _write_parquet_cache, or None if there is no usable cache"""
+        if not os.path.isdir(cache_dir):
+            return None
+        try:
+            data = {}
+            # Files are named "<position>.<sheet>.parquet" to keep the workbook's sheet order
+            for filename in sorted(os.listdir(cache_dir)):
+                sheet_name = filename.split('.', 1)[1].rsplit('.', 1)[0]
+                data[sheet_name] = pd.read_parquet(os.path.join(cache_dir, filename), engine='pyarrow')
+            return data
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable Parquet cache {cache_dir}: {str(e)}")
+            return None
+    
+    def _write_parquet_cache(self, file_path: Union[str, os.PathLike], cache_dir: str):
+        """Persist the cleaned sheets next to the workbook; failures only cost the cache"""
+        tmp_dir = f"{cache_dir}.tmp{os.getpid()}"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            for position, (sheet_name, df) in enumerate(self.data.items()):
+                df.to_parquet(os.path.join(tmp_dir, f"{position:02d}.{sheet_name}.parquet"),
+                              engine='pyarrow', compression='zstd')
+            # Publish the complete directory in one step so readers never see a partial cache
+            os.replace(tmp_dir, cache_dir)
+            # Caches of earlier versions of the workbook and temp directories of interrupted
+            # writes are never read again
+            for stale_dir in glob.glob(f"{glob.escape(os.fspath(file_path))}.*.parquet_dir*"):
+                if stale_dir != cache_dir:
+                    shutil.rmtree(stale_dir, ignore_errors=True)
+        except Exception as e:
+            logger.warning(f"Could not write Parquet cache {cache_dir}: {str(e)}")
+            if os.path.isdir(tmp_dir):
+                for filename in os.listdir(tmp_dir):
+                    os.remove(os.path.join(tmp_dir, filename))
+                os.rmdir(tmp_dir)
+    
+    def _read_sheet_from_file(self, source: Union[str, os.PathLike, bytes], sheet_name: str) -> pd.DataFrame:
+        """Open the workbook and parse a single sheet; used by the parallel loader"""
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)  # a private cursor over the shared bytes
+        with pd.ExcelFile(source, engine=EXCEL_ENGINE) as workbook:
+            return self._read_sheet(workbook, sheet_name)
+    
+    def _read_sheet(self, workbook: pd.ExcelFile, sheet_name: str) -> pd.DataFrame:
+        """Parse one sheet with its declared dtypes and date columns"""
+        dtypes = SHEET_DTYPES.get(sheet_name)
+        parse_dates = SHEET_DATES.get(sheet_name, False)
+        try:
+            return workbook.parse(sheet_name, dtype=dtypes, parse_dates=parse_dates)
+        except ValueError:
+            if not dtypes:
+                raise
+            # Blank or non-numeric cells can't take the declared dtype; coerce them to NaN instead
+            logger.warning(f"Sheet {sheet_name} has non-numeric values, coercing")
+            df = workbook.parse(sheet_name, parse_dates=parse_dates)
+            numeric_cols = [col for col in dtypes if col in df.columns]
+            df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
+            # Keep the narrower float types that were declared (integer columns stay float once NaN appears)
+            return df.astype({col: dtypes[col] for col in numeric_cols if dtypes[col] == 'float32'})
+    
     def _clean_data(self):
         """Clean and standardize data across all sheets"""
-        # Clean Portfolio Overview
-        if 'Portfolio_Overview' in self.data:
-            df = self.data['Portfolio_Overview']
-            df['Inception_Date'] = pd.to_datetime(df['Inception_Date'])
-            df['Last_Updated'] = pd.to_datetime(df['Last_Updated'])
-            df['Total_AUM'] = pd.to_numeric(df['Total_AUM'], errors='coerce')
-            df['Target_Return'] = pd.to_numeric(df['Target_Return'], errors='coerce')
+        # Dates and numeric columns are already typed by _read_sheet
         
         # Clean Holdings Detail
         if 'Holdings_Detail' in self.data:
             df = self.data['Holdings_Detail']
-            df['Purchase_Date'] = pd.to_datetime(df['Purchase_Date'])
-            numeric_cols = ['Market_Value', 'Units_Held', 'Average_Cost', 'Current_Price', 'Weight_Percent', 'Dividend_Yield']
-            for col in numeric_cols:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+            
+            # Guarantee the descriptive columns the AI summary reads, once at load time
+            for col, default in (('Asset_Name', 'Unknown'), ('Ticker_Symbol', 'N/A'),
+                                 ('Sector', 'Unknown'), ('ESG_Rating', 'N/A')):
+                if col not in df.columns:
+                    df[col] = default
+            
+            # Low-cardinality labels as categoricals: groupby/value_counts work on integer codes
+            for col in ('Sector', 'Ticker_Symbol', 'ESG_Rating', 'Asset_Name'):
+                df[col] = df[col].astype('category')
+            for col in ('Asset_Type', 'Geography'):
+                if col in df.columns:
+                    df[col] = df[col].astype('category')
+            
+            # Largest positions first, once, as the canonical order for the tables and top-N views;
+            # stable so equal values keep the workbook's order, missing values go last
+            df.sort_values('Market_Value', ascending=False, kind='mergesort', inplace=True, ignore_index=True)
         
         # Clean time series data
         time_series_sheets = ['Historical_Performance', 'Benchmarks', 'Risk_Metrics', 'Cash_Flows', 'Market_Data']
         for sheet_name in time_series_sheets:
             if sheet_name in self.data:
-                df = self.data[sheet_name]
-                df['Date'] = pd.to_datetime(df['Date'])
-                df = df.sort_values('Date')
-                
-                # Convert numeric columns
-                numeric_cols = df.select_dtypes(include=[np.number]).columns
-                for col in numeric_cols:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                
-                self.data[sheet_name] = df
+                # Sheets are usually already chronological, where stable mergesort is near-linear
+                self.data[sheet_name].sort_values('Date', kind='mergesort', inplace=True, ignore_index=True)
     
     def _calculate_metrics(self):
         """Calculate additional portfolio metrics"""
         self.processed_data = {}
+        self._ai_summary_cache = None
         
         # Portfolio summary metrics
         if 'Portfolio_Overview' in self.data and 'Holdings_Detail' in self.data:
@@ -101,16 +307,60 @@ class PortfolioDataProcessor:
         # Top holdings
         if 'Holdings_Detail' in self.data:
             holdings = self.data['Holdings_Detail']
-            top_holdings = holdings.nlargest(10, 'Market_Value')[
-                ['Asset_Name', 'Ticker_Symbol', 'Market_Value', 'Weight_Percent', 'Sector']
-            ].to_dict('records')
-            self.processed_data['top_holdings'] = top_holdings
+            # O(n) partition for the top 10 instead of sorting the whole frame. Non-finite values are
+            # never selected, even with fewer than 10 valid rows; as with nlargest(keep='first'),
+            # ties at the cut-off go to the earliest rows and ties keep their original row order
+            values = holdings['Market_Value'].to_numpy(dtype='float64', na_value=np.nan)
+            valid = np.flatnonzero(np.isfinite(values))
+            k = min(10, valid.size)
+            top_idx = valid
+            if k:
+                valid_values = values[valid]
+                cutoff = np.partition(valid_values, valid.size - k)[valid.size - k]
+                above = valid[valid_values > cutoff]
+                top_idx = np.concatenate([above, valid[valid_values == cutoff][:k - above.size]])
+            top_idx = top_idx[np.lexsort((top_idx, -values[top_idx]))]
+            top_holdings_df = holdings.iloc[top_idx][
+                ['Asset_Name', 'Ticker_Symbol', 'Market_Value', 'Weight_Percent', 'Sector', 'ESG_Rating']
+            ]
+            # Row tuples for the prompt builder; get_holdings_data keeps handing out the dict records.
+            # Plain tuples, as itertuples' namedtuple class can't be pickled by st.cache_data
+            self.processed_data['top_holdings_rows'] = list(top_holdings_df.itertuples(index=False, name=None))
+            # Column-wise view for the dashboard tables and charts, so they don't rebuild a frame per rerun
+            top_view = top_holdings_df.drop(columns='ESG_Rating').reset_index(drop=True)
+            self.processed_data['top_holdings'] = top_view.to_dict('records')
+            # Display strings formatted once here rather than by a Styler on every rerun
+            top_view['Weight_Percent_fmt'] = top_view['Weight_Percent'].map('{:.2%}'.format)
+            top_view['Market_Value_fmt'] = top_view['Market_Value'].map('₹{:,.0f}'.format)
+            self.processed_data['top_holdings_df'] = top_view
+            
+            # Holdings Detail table (rows already largest first), numeric columns preformatted the same way
+            table = holdings[[col for col in HOLDINGS_TABLE_COLUMNS if col in holdings.columns]].copy()
+            for col, fmt in HOLDINGS_TABLE_FORMATS.items():
+                if col in table.columns:
+                    table[col] = table[col].map(fmt.format)
+            self.processed_data['holdings_table'] = table
         
         # Sector allocation
         if 'Holdings_Detail' in self.data:
             holdings = self.data['Holdings_Detail']
-            sector_allocation = holdings.groupby('Sector')['Market_Value'].sum().sort_values(ascending=False)
-            self.processed_data['sector_allocation'] = sector_allocation.to_dict()
+            market_values = holdings['Market_Value'].to_numpy(dtype='float64', na_value=np.nan)
+            
+            # Largest sectors first
+            names, sums, counts = _category_totals(holdings['Sector'], market_values)
+            order = np.argsort(-sums, kind='stable')
+            sector_names = names[order].tolist()
+            self.processed_data['sector_allocation'] = dict(zip(sector_names, sums[order].tolist()))
+            self.processed_data['sector_counts'] = dict(zip(sector_names, counts[order].tolist()))
+            
+            # Geographic split (in label order) and ESG rating counts (most common first) for the
+            # holdings charts, from the same single pass over the category codes
+            if 'Geography' in holdings.columns:
+                names, sums, _ = _category_totals(holdings['Geography'], market_values)
+                self.processed_data['geographic_allocation'] = dict(zip(names.tolist(), sums.tolist()))
+            names, _, counts = _category_totals(holdings['ESG_Rating'])
+            order = np.argsort(-counts, kind='stable')
+            self.processed_data['esg_distribution'] = dict(zip(names[order].tolist(), counts[order].tolist()))
         
         # Performance metrics
         if 'Historical_Performance' in self.data:
@@ -143,14 +393,14 @@ class PortfolioDataProcessor:
             }
     
     def get_time_series_data(self, sheet_name: str, columns: List[str] = None) -> pd.DataFrame:
-        """Get time series data for charting"""
+        """Get time series data for charting. The full sheet is returned without a copy, so treat it as read-only"""
         if sheet_name not in self.data:
             raise ValueError(f"Sheet {sheet_name} not found")
         
-        df = self.data[sheet_name].copy()
+        df = self.data[sheet_name]
         if columns:
             columns_with_date = ['Date'] + [col for col in columns if col in df.columns]
-            df = df[columns_with_date]
+            return df[columns_with_date]
         
         return df
     
@@ -162,10 +412,22 @@ class PortfolioDataProcessor:
         """Get holdings analysis"""
         return {
             'top_holdings': self.processed_data.get('top_holdings', []),
+            'top_holdings_df': self.processed_data.get('top_holdings_df', pd.DataFrame()),
             'sector_allocation': self.processed_data.get('sector_allocation', {}),
+            'sector_counts': self.processed_data.get('sector_counts', {}),
+            'holdings_table': self.processed_data.get('holdings_table', pd.DataFrame()),
+            'geographic_allocation': self.processed_data.get('geographic_allocation', {}),
+            'esg_distribution': self.processed_data.get('esg_distribution', {}),
             'total_holdings': self.processed_data.get('portfolio_summary', {}).get('total_holdings', 0)
         }
     
+    def get_ai_holdings(self, limit: int = None) -> pd.DataFrame:
+        """Largest holdings by market value for the AI prompt (AI_HOLDINGS_LIMIT rows by default)"""
+        holdings = self.data.get('Holdings_Detail')
+        if holdings is None or 'Market_Value' not in holdings:
+            return pd.DataFrame()
+        return holdings.nlargest(limit or AI_HOLDINGS_LIMIT, 'Market_Value')
+    
     def get_performance_data(self) -> Dict[str, Any]:
         """Get performance metrics"""
         return self.processed_data.get('performance_summary', {})
@@ -176,64 +438,64 @@ class PortfolioDataProcessor:
     
     def prepare_data_for_ai(self) -> str:
         """Prepare structured data summary for AI analysis"""
-        summary = []
+        if self._ai_summary_cache is not None:
+            return self._ai_summary_cache
+        
+        buf = io.StringIO()
+        write = buf.write
         
         # Portfolio overview
         portfolio = self.get_portfolio_summary()
         if portfolio:
-            summary.append(f"=== PORTFOLIO OVERVIEW ===")
-            summary.append(f"Portfolio: {portfolio.get('fund_name', 'Unknown')}")
-            summary.append(f"AUM: {portfolio.get('total_aum', 0):,.0f} {portfolio.get('base_currency', 'INR')}")
-            summary.append(f"Target Return: {portfolio.get('target_return', 0):.1%}")
-            summary.append(f"Risk Level: {portfolio.get('risk_level', 'Unknown')}")
-            summary.append(f"Total Holdings: {portfolio.get('total_holdings', 0)}")
-            summary.append("")
+            write(_OVERVIEW_HEADER)
+            write(f"Portfolio: {portfolio.get('fund_name', 'Unknown')}\n")
+            write(f"AUM: {portfolio.get('total_aum', 0):,.0f} {portfolio.get('base_currency', 'INR')}\n")
+            write(f"Target Return: {portfolio.get('target_return', 0):.1%}\n")
+            write(f"Risk Level: {portfolio.get('risk_level', 'Unknown')}\n")
+            write(f"Total Holdings: {portfolio.get('total_holdings', 0)}\n")
+            write("\n")
         
         # Performance
         performance = self.get_performance_data()
         if performance:
-            summary.append(f"=== PERFORMANCE METRICS ===")
-            summary.append(f"Current Value: {performance.get('current_value', 0):,.0f}")
-            summary.append(f"Total Return: {performance.get('total_return', 0):.2%}")
-            summary.append(f"Volatility: {performance.get('volatility', 0):.2%}")
-            summary.append(f"Sharpe Ratio: {performance.get('sharpe_ratio', 0):.2f}")
-            summary.append("")
+            write(_PERFORMANCE_HEADER)
+            write(f"Current Value: {performance.get('current_value', 0):,.0f}\n")
+            write(f"Total Return: {performance.get('total_return', 0):.2%}\n")
+            write(f"Volatility: {performance.get('volatility', 0):.2%}\n")
+            write(f"Sharpe Ratio: {performance.get('sharpe_ratio', 0):.2f}\n")
+            write("\n")
         
         # Risk metrics
         risk = self.get_risk_data()
         if risk:
-            summary.append(f"=== RISK METRICS ===")
-            summary.append(f"Portfolio Beta: {risk.get('portfolio_beta', 0):.2f}")
-            summary.append(f"VaR (95%): {risk.get('var_95', 0):,.0f}")
-            summary.append(f"Tracking Error: {risk.get('tracking_error', 0):.2%}")
-            summary.append("")
+            write(_RISK_HEADER)
+            write(f"Portfolio Beta: {risk.get('portfolio_beta', 0):.2f}\n")
+            write(f"VaR (95%): {risk.get('var_95', 0):,.0f}\n")
+            write(f"Tracking Error: {risk.get('tracking_error', 0):.2%}\n")
+            write("\n")
         
         # DETAILED HOLDINGS LIST
         holdings = self.get_holdings_data()
-        if holdings.get('top_holdings'):
-            summary.append(f"=== DETAILED HOLDINGS ({len(holdings['top_holdings'])} companies) ===")
-            for i, holding in enumerate(holdings['top_holdings']):
-                summary.append(
-                    f"{i+1:2d}. {holding.get('Asset_Name', 'Unknown'):<35} "
-                    f"| Ticker: {holding.get('Ticker_Symbol', 'N/A'):<15} "
-                    f"| Sector: {holding.get('Sector', 'Unknown'):<20} "
-                    f"| Weight: {holding.get('Weight_Percent', 0):>6.2%} "
-                    f"| Value: ₹{holding.get('Market_Value', 0):>15,.0f} "
-                    f"| ESG: {holding.get('ESG_Rating', 'N/A'):<3}"
-                )
-            summary.append("")
+        top_holdings_rows = self.processed_data.get('top_holdings_rows')
+        if top_holdings_rows:
+            write(f"=== DETAILED HOLDINGS ({len(top_holdings_rows)} companies) ===\n")
+            for i, (name, ticker, market_value, weight, sector, esg) in enumerate(top_holdings_rows, 1):
+                write(_TOP_HOLDING_LINE_FMT(i, name, ticker, sector, weight, market_value, esg))
+            write("\n")
         
         # Sector breakdown
         if holdings.get('sector_allocation'):
-            summary.append(f"=== SECTOR ALLOCATION ===")
+            write(_SECTOR_HEADER)
             total_value = sum(holdings['sector_allocation'].values())
             sorted_sectors = sorted(holdings['sector_allocation'].items(), key=lambda x: x[1], reverse=True)
             for sector, value in sorted_sectors:
                 weight = value / total_value if total_value > 0 else 0
-                summary.append(f"- {sector:<25}: {weight:>6.1%} (₹{value:>15,.0f})")
-            summary.append("")
+                write(f"- {sector:<25}: {weight:>6.1%} (₹{value:>15,.0f})\n")
+            write("\n")
         
-        return "\n".join(summary)
+        # Every line is newline-terminated; drop the last one so the text ends as it did when joined
+        self._ai_summary_cache = buf.getvalue()[:-1]
+        return self._ai_summary_cache
     
     def get_raw_data(self, sheet_name: str) -> pd.DataFrame:
         """Get raw sheet data"""
@@ -2,116 +2,150 @@ import faiss
 import numpy as np
 import pandas as pd
 from typing import List, Dict, Any, Tuple
+import json
 import pickle
 import logging
 from datetime import datetime
 import os
+import re
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Query keyword -> context section added by get_context_for_query; keywords match as
+# substrings ("risks", "returns", "holdings") and sections are tried in priority order
+KEYWORD_MAP = {
+    'risk': 'risk',
+    'performance': 'performance',
+    'return': 'performance',
+    'holding': 'holdings',
+    'sector': 'holdings',
+}
+_KEYWORD_RE = re.compile('|'.join(KEYWORD_MAP))
+_CONTEXT_PRIORITY = ('risk', 'performance', 'holdings')
+
+# Columns of the metadata table, one row per vector id; the low-cardinality ones are categorical
+METADATA_COLUMNS = ['timestamp', 'data_summary', 'portfolio_name', 'total_return', 'volatility', 'risk_level']
+_CATEGORICAL_METADATA = ['portfolio_name', 'risk_level']
+
+def _metadata_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Build a metadata table from a list of metadata records"""
+    frame = pd.DataFrame.from_records(records, columns=METADATA_COLUMNS)
+    frame[_CATEGORICAL_METADATA] = frame[_CATEGORICAL_METADATA].astype('category')
+    return frame
+
+def _sector_features(values: np.ndarray, out: np.ndarray, i: int) -> None:
+    """Write the top 5 sector weights (descending, zero-filled) to out[i:i+5] and the Herfindahl index to out[i+5]"""
+    weights = values / (values.sum() or 1)
+    top = np.partition(weights, -5)[-5:] if weights.size > 5 else weights
+    top = np.sort(top)[::-1]
+    out[i:i + top.size] = top
+    out[i + 5] = weights @ weights
+
 class PortfolioVectorStore:
     """FAISS-based vector store for portfolio data and context retrieval"""
     
-    def __init__(self, dimension: int = 384):
+    def __init__(self, dimension: int = 384, batch_size: int = 64):
         self.dimension = dimension
         self.index = None
-        self.embeddings = []
-        self.metadata = []
+        self.metadata = _metadata_frame([])
         self.is_trained = False
         
-        # Initialize FAISS index (CPU)
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product for similarity
+        # Single adds are buffered and sent to FAISS in one call per batch
+        self.batch_size = batch_size
+        self._pending = []  # (embedding, metadata) not yet in the index
+        
+        self.index = self._new_index()
+    
+    def _new_index(self):
+        """Create an empty index sized for this store"""
+        # FAISS index (CPU): HNSW graph over inner product for sub-linear search; vectors are
+        # L2-normalized so inner product is cosine similarity. They are stored uncompressed:
+        # snapshot differences (~1e-3 after normalization) are below an 8-bit quantizer step,
+        # so scalar quantization loses exact matches
+        index = faiss.IndexHNSWFlat(self.dimension, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 80
+        index.hnsw.efSearch = 32
+        return index
+    
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Indexed (normalized) vectors, read back from the index"""
+        if self.index.ntotal == 0:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return self.index.reconstruct_n(0, self.index.ntotal)
         
     def _create_embeddings(self, data: Dict[str, Any]) -> np.ndarray:
         """Create embeddings from portfolio data"""
         try:
-            # Extract numerical features for embedding
-            features = []
+            # Features are written straight into a zeroed buffer, which doubles as the padding
+            out = np.zeros(self.dimension, dtype=np.float32)
+            i = 0
             
             # Portfolio level features
             if 'portfolio_summary' in data:
                 portfolio = data['portfolio_summary']
-                features.extend([
+                out[i:i + 3] = (
                     float(portfolio.get('total_aum', 0)) / 1e9,  # Normalized AUM
                     float(portfolio.get('target_return', 0)),
                     float(portfolio.get('total_holdings', 0)) / 100,  # Normalized holdings count
-                ])
+                )
+                i += 3
             
             # Performance features
             if 'performance_summary' in data:
                 perf = data['performance_summary']
-                features.extend([
+                out[i:i + 6] = (
                     float(perf.get('total_return', 0)),
                     float(perf.get('daily_return', 0)),
                     float(perf.get('volatility', 0)),
                     float(perf.get('sharpe_ratio', 0)),
                     float(perf.get('max_drawdown', 0)),
                     float(perf.get('active_return', 0))
-                ])
+                )
+                i += 6
             
             # Risk features
             if 'risk_summary' in data:
                 risk = data['risk_summary']
-                features.extend([
+                out[i:i + 6] = (
                     float(risk.get('portfolio_beta', 0)),
                     float(risk.get('var_95', 0)) / 1e6,  # Normalized VaR
                     float(risk.get('tracking_error', 0)),
                     float(risk.get('correlation_benchmark', 0)),
                     float(risk.get('concentration_risk', 0)),
                     float(risk.get('liquidity_score', 0)) / 10
-                ])
+                )
+                i += 6
             
             # Sector diversification features
             if 'sector_allocation' in data:
                 sectors = data['sector_allocation']
-                total_value = sum(sectors.values()) if sectors else 1
-                # Top 5 sectors by weight
-                sector_weights = sorted(sectors.values(), reverse=True)[:5] if sectors else [0] * 5
-                normalized_weights = [w / total_value for w in sector_weights]
-                features.extend(normalized_weights)
-                
-                # Sector concentration (Herfindahl index)
-                herfindahl = sum((w / total_value) ** 2 for w in sectors.values()) if sectors else 0
-                features.append(herfindahl)
-            
-            # Pad or truncate to fixed dimension
-            while len(features) < self.dimension:
-                features.append(0.0)
-            features = features[:self.dimension]
+                _sector_features(np.fromiter(sectors.values(), dtype=np.float64, count=len(sectors)), out, i)
+                i += 6
             
-            return np.array(features, dtype=np.float32)
+            return out
             
         except Exception as e:
             logger.error(f"Error creating embeddings: {str(e)}")
             return np.zeros(self.dimension, dtype=np.float32)
     
-    def add_portfolio_data(self, processed_data: Dict[str, Any], timestamp: str = None) -> int:
-        """Add portfolio data to vector store"""
+    def add_portfolio_data(self, processed_data: Dict[str, Any], timestamp: str = None,
+                           embedding: np.ndarray = None, metadata: Dict[str, Any] = None) -> int:
+        """Add portfolio data to vector store (buffered; flushed every batch_size adds or before a search).
+        An embedding or metadata record computed by the caller is used as-is instead of being rebuilt"""
         try:
-            # Create embedding
-            embedding = self._create_embeddings(processed_data)
-            
-            # Create metadata
-            metadata = {
-                'timestamp': timestamp or datetime.now().isoformat(),
-                'data_summary': self._create_data_summary(processed_data),
-                'portfolio_name': processed_data.get('portfolio_summary', {}).get('fund_name', 'Unknown'),
-                'total_return': processed_data.get('performance_summary', {}).get('total_return', 0),
-                'volatility': processed_data.get('performance_summary', {}).get('volatility', 0),
-                'risk_level': processed_data.get('portfolio_summary', {}).get('risk_level', 'Unknown')
-            }
-            
-            # Add to index
-            embedding_reshaped = embedding.reshape(1, -1)
-            self.index.add(embedding_reshaped)
-            
-            # Store metadata
-            vector_id = len(self.embeddings)
-            self.embeddings.append(embedding)
-            self.metadata.append(metadata)
-            
-            self.is_trained = True
+            # Create embedding and metadata
+            if embedding is None:
+                embedding = self._create_embeddings(processed_data)
+            if metadata is None:
+                metadata = self._extract_metadata(processed_data, timestamp)
+            
+            vector_id = len(self.metadata) + len(self._pending)
+            self._pending.append((embedding, metadata))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+            
             logger.info(f"Added portfolio data with ID: {vector_id}")
             
             return vector_id
@@ -120,6 +154,67 @@ class PortfolioVectorStore:
             logger.error(f"Error adding portfolio data: {str(e)}")
             raise
     
+    def add_portfolio_data_batch(self, processed_data_list: List[Dict[str, Any]],
+                                 timestamps: List[str] = None) -> List[int]:
+        """Add several portfolio snapshots with a single FAISS add"""
+        try:
+            # Keep ids in insertion order
+            self.flush()
+            
+            n = len(processed_data_list)
+            batch = np.empty((n, self.dimension), dtype=np.float32)
+            metadata = []
+            for i, processed_data in enumerate(processed_data_list):
+                batch[i] = self._create_embeddings(processed_data)
+                metadata.append(self._extract_metadata(processed_data, timestamps[i] if timestamps else None))
+            
+            first_id = len(self.metadata)
+            self._add_batch(batch, metadata)
+            logger.info(f"Added {n} portfolio snapshots with IDs {first_id}-{first_id + n - 1}")
+            
+            return list(range(first_id, first_id + n))
+            
+        except Exception as e:
+            logger.error(f"Error adding portfolio data batch: {str(e)}")
+            raise
+    
+    def flush(self):
+        """Add all buffered embeddings to the index"""
+        if not self._pending:
+            return
+        embeddings, metadata = zip(*self._pending)
+        self._pending = []
+        self._add_batch(np.stack(embeddings), list(metadata))
+    
+    def _add_batch(self, batch: np.ndarray, metadata: List[Dict[str, Any]]):
+        """Normalize a (n, dimension) float32 block and add it to the index in one call"""
+        if len(batch) == 0:
+            return
+        faiss.normalize_L2(batch)
+        self.index.add(batch)
+        new_rows = _metadata_frame(metadata)
+        if self.metadata.empty:
+            self.metadata = new_rows
+        else:
+            # Categories differ between batches, so concat falls back to object and they are re-derived
+            combined = pd.concat([self.metadata, new_rows], ignore_index=True)
+            combined[_CATEGORICAL_METADATA] = combined[_CATEGORICAL_METADATA].astype('category')
+            self.metadata = combined
+        self.is_trained = True
+    
+    def _extract_metadata(self, processed_data: Dict[str, Any], timestamp: str = None) -> Dict[str, Any]:
+        """Create the metadata record stored with an embedding"""
+        portfolio = processed_data.get('portfolio_summary', {})
+        perf = processed_data.get('performance_summary', {})
+        return {
+            'timestamp': timestamp if timestamp else datetime.now().isoformat(),
+            'data_summary': self._create_data_summary(processed_data),
+            'portfolio_name': portfolio.get('fund_name', 'Unknown'),
+            'total_return': perf.get('total_return', 0),
+            'volatility': perf.get('volatility', 0),
+            'risk_level': portfolio.get('risk_level', 'Unknown')
+        }
+    
     def _create_data_summary(self, data: Dict[str, Any]) -> str:
         """Create text summary of portfolio data"""
         summary_parts = []
@@ -146,22 +241,25 @@ class PortfolioVectorStore:
     def search_similar_portfolios(self, query_data: Dict[str, Any], k: int = 3) -> List[Dict[str, Any]]:
         """Search for similar portfolio states"""
         try:
-            if not self.is_trained or len(self.embeddings) == 0:
+            self.flush()
+            if not self.is_trained or self.index.ntotal == 0:
                 return []
             
             # Create query embedding
             query_embedding = self._create_embeddings(query_data)
             query_reshaped = query_embedding.reshape(1, -1)
+            faiss.normalize_L2(query_reshaped)
             
             # Search
-            scores, indices = self.index.search(query_reshaped, min(k, len(self.embeddings)))
+            scores, indices = self.index.search(query_reshaped, min(k, self.index.ntotal))
             
             results = []
             for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                if idx < len(self.metadata):
+                # HNSW pads missing neighbours with -1
+                if 0 <= idx < len(self.metadata):
                     result = {
                         'similarity_score': float(score),
-                        'metadata': self.metadata[idx],
+                        'metadata': self.metadata.iloc[idx].to_dict(),
                         'rank': i + 1
                     }
                     results.append(result)
@@ -192,16 +290,17 @@ class PortfolioVectorStore:
                     metadata = result['metadata']
                     context_parts.append(f"- {metadata['data_summary']} (Similarity: {result['similarity_score']:.3f})")
             
-            # Add query-specific context
-            query_lower = query.lower()
-            if 'risk' in query_lower:
+            # Add query-specific context: one regex scan finds every keyword in the query
+            kinds = {KEYWORD_MAP[keyword] for keyword in _KEYWORD_RE.findall(query.lower())}
+            kind = next((k for k in _CONTEXT_PRIORITY if k in kinds), None)
+            if kind == 'risk':
                 if 'risk_summary' in current_data:
                     risk = current_data['risk_summary']
                     context_parts.append(f"\nRISK CONTEXT:")
                     context_parts.append(f"Beta: {risk.get('portfolio_beta', 0):.2f}, VaR: {risk.get('var_95', 0):,.0f}")
                     context_parts.append(f"Tracking Error: {risk.get('tracking_error', 0):.3f}")
             
-            elif 'performance' in query_lower or 'return' in query_lower:
+            elif kind == 'performance':
                 if 'performance_summary' in current_data:
                     perf = current_data['performance_summary']
                     context_parts.append(f"\nPERFORMANCE CONTEXT:")
@@ -209,7 +308,7 @@ class PortfolioVectorStore:
                     context_parts.append(f"Volatility: {perf.get('volatility', 0):.2%}")
                     context_parts.append(f"Sharpe Ratio: {perf.get('sharpe_ratio', 0):.2f}")
             
-            elif 'holding' in query_lower or 'sector' in query_lower:
+            elif kind == 'holdings':
                 if 'top_holdings' in current_data:
                     context_parts.append(f"\nHOLDINGS CONTEXT:")
                     for holding in current_data['top_holdings'][:3]:
@@ -224,17 +323,18 @@ class PortfolioVectorStore:
     def save_index(self, filepath: str):
         """Save FAISS index and metadata"""
         try:
+            self.flush()
+            
             # Save FAISS index
             faiss.write_index(self.index, f"{filepath}.index")
             
-            # Save metadata
-            with open(f"{filepath}.metadata", 'wb') as f:
-                pickle.dump({
-                    'embeddings': self.embeddings,
-                    'metadata': self.metadata,
+            # Save metadata as a JSON sidecar; the vectors themselves live in the index file
+            with open(f"{filepath}.metadata.json", 'w', encoding='utf-8') as f:
+                json.dump({
+                    'metadata': self.metadata.to_dict('records'),
                     'dimension': self.dimension,
                     'is_trained': self.is_trained
-                }, f)
+                }, f, default=str)
             
             logger.info(f"Saved vector store to {filepath}")
             
@@ -247,15 +347,34 @@ class PortfolioVectorStore:
         try:
             if os.path.exists(f"{filepath}.index"):
                 # Load FAISS index
-                self.index = faiss.read_index(f"{filepath}.index")
+                index = faiss.read_index(f"{filepath}.index")
+                
+                # Load metadata (stores saved before the JSON sidecar still use the pickle file)
+                if os.path.exists(f"{filepath}.metadata.json"):
+                    with open(f"{filepath}.metadata.json", 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                else:
+                    with open(f"{filepath}.metadata", 'rb') as f:
+                        data = pickle.load(f)
+                
+                self.metadata = _metadata_frame(data['metadata'])
+                self.dimension = data['dimension']
+                self.is_trained = data['is_trained']
+                
+                # Buffered adds belong to the store being replaced
+                self._pending = []
                 
-                # Load metadata
-                with open(f"{filepath}.metadata", 'rb') as f:
-                    data = pickle.load(f)
-                    self.embeddings = data['embeddings']
-                    self.metadata = data['metadata']
-                    self.dimension = data['dimension']
-                    self.is_trained = data['is_trained']
+                if isinstance(index, faiss.IndexHNSWFlat) and index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                    self.index = index
+                else:
+                    # Older stores hold un-normalized vectors in an IndexFlatIP; rebuild them into the
+                    # current index so every vector is scored on the same scale
+                    self.index = self._new_index()
+                    if index.ntotal:
+                        vectors = index.reconstruct_n(0, index.ntotal)
+                        faiss.normalize_L2(vectors)
+                        self.index.add(vectors)
+                    logger.info(f"Rebuilt legacy {type(index).__name__} with {index.ntotal} vectors")
                 
                 logger.info(f"Loaded vector store from {filepath}")
                 return True
@@ -268,8 +387,9 @@ class PortfolioVectorStore:
     
     def get_stats(self) -> Dict[str, Any]:
         """Get vector store statistics"""
+        self.flush()
         return {
-            'total_vectors': len(self.embeddings),
+            'total_vectors': self.index.ntotal,
             'dimension': self.dimension,
             'is_trained': self.is_trained,
             'index_size': self.index.ntotal if self.index else 0
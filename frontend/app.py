@@ -4,6 +4,8 @@ import numpy as np
 from datetime import datetime
 import os
 import sys
+import hashlib
+from typing import TYPE_CHECKING
 
 # Add backend to path - go up one level from frontend to root, then into backend
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -13,19 +15,35 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-# Now import from backend
+# Read once per script run instead of at every use
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+# Series plotted as float32: plotly's orjson encoder writes them about a third shorter, with no
+# visible difference. VaR/CVaR (tens of millions) round by a rupee or two at most; Portfolio_Value
+# stays float64 since at trillions float32 would be off by lakhs
+CHART_FLOAT32_COLUMNS = (
+    'Daily_Return', 'Cumulative_Return', 'Benchmark_Return', 'Active_Return',
+    'Volatility', 'Sharpe_Ratio', 'Max_Drawdown', 'VaR_95', 'CVaR_95',
+)
+
+def _has_api_key() -> bool:
+    """Whether a Gemini API key is configured"""
+    return bool(GEMINI_API_KEY)
+
+# Now import from backend; ai_engine (Gemini SDK, FAISS) is imported on first use in get_ai_engine
 from data_processor import PortfolioDataProcessor
-from ai_engine import PortfolioAIEngine
+if TYPE_CHECKING:
+    from ai_engine import PortfolioAIEngine
 
 # Import from current frontend directory
 from components import (
     render_portfolio_overview, render_performance_charts, 
     render_holdings_analysis, render_risk_dashboard,
-    render_recommendations_section, render_chat_interface
+    render_recommendations_section, render_chat_interface, group_recommendations_by_priority
 )
 from utils import (
-    initialize_session_state, load_custom_css,
-    format_currency, format_percentage
+    initialize_session_state, reset_portfolio_state, load_custom_css,
+    format_currency, format_percentage, build_ai_payload
 )
 
 # Page config
@@ -64,8 +82,8 @@ def main():
         
         # AI Status
         st.markdown("### 🤖 AI Status")
-        api_key = os.getenv('GEMINI_API_KEY')
-        if api_key:
+        api_key = GEMINI_API_KEY
+        if _has_api_key():
             st.success("✅ Gemini API configured")
         else:
             st.error("❌ GEMINI_API_KEY not set in environment")
@@ -75,7 +93,7 @@ def main():
         if st.session_state.get('data_loaded', False) and api_key:
             if st.button("🤖 Generate AI Analysis", help="Manually trigger AI analysis"):
                 st.session_state.ai_analysis_done = False
-                trigger_ai_analysis()
+                trigger_ai_analysis(regenerate=True)
         
         # Data status
         if 'data_loaded' in st.session_state and st.session_state.data_loaded:
@@ -93,9 +111,8 @@ def main():
             
             # Add reset button
             if st.button("🔄 Reset Data", help="Clear all data and start fresh"):
-                # Clear all session state data
-                for key in list(st.session_state.keys()):
-                    del st.session_state[key]
+                # Clear the portfolio and AI state, leaving Streamlit's widget state alone
+                reset_portfolio_state()
                 st.rerun()
         else:
             st.warning("⚠️ Please upload portfolio data")
@@ -105,32 +122,46 @@ def main():
         display_dashboard()
         
         # Show chat interface outside tabs if data is loaded and API key exists
-        api_key = os.getenv('GEMINI_API_KEY')
-        if st.session_state.get('data_loaded', False) and api_key:
+        if st.session_state.get('data_loaded', False) and _has_api_key():
             
             st.markdown("---")
             st.markdown("### 💬 Portfolio Chat Assistant")
             
             # Initialize AI engine if not exists
-            if 'ai_engine' not in st.session_state:
-                try:
-                    st.session_state.ai_engine = PortfolioAIEngine(api_key=api_key)
-                except Exception as e:
-                    st.error(f"❌ Failed to initialize AI engine: {str(e)}")
-                    st.stop()
+            try:
+                engine = get_ai_engine(api_key)
+            except Exception as e:
+                st.error(f"❌ Failed to initialize AI engine: {str(e)}")
+                st.stop()
             
-            render_chat_interface(st.session_state.ai_engine)
+            render_chat_interface(engine)
         elif st.session_state.get('data_loaded', False):
             st.markdown("---")
             st.warning("🔑 Set GEMINI_API_KEY environment variable to enable chat")
     else:
         display_welcome_screen()
 
-def trigger_ai_analysis():
-    """Trigger AI analysis manually"""
+def get_ai_engine(api_key: str) -> 'PortfolioAIEngine':
+    """This session's AI engine, created on first use. Engines keep per-user chat history and
+    vector-store snapshots, so they stay per session; the Gemini client and event loop are process-wide"""
+    if 'ai_engine' not in st.session_state:
+        # Deferred so the welcome screen and uploads don't pay for importing the Gemini SDK
+        from ai_engine import PortfolioAIEngine
+        st.session_state.ai_engine = PortfolioAIEngine(api_key=api_key)
+    return st.session_state.ai_engine
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_ai_results(data_hash: str, _engine: 'PortfolioAIEngine', _processed_data: dict,
+                       _refresh: bool = False) -> tuple:
+    """Analysis and recommendations for the upload identified by data_hash (the engine, payload and
+    refresh flag aren't hashed; _refresh also bypasses the engine's own response cache)"""
+    return _engine.analyze_and_recommend(_processed_data, refresh=_refresh)
+
+def trigger_ai_analysis(regenerate: bool = False):
+    """Trigger AI analysis manually; regenerate=True asks Gemini again instead of reusing cached results"""
     try:
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
+        api_key = GEMINI_API_KEY
+        if not _has_api_key():
             st.error("❌ GEMINI_API_KEY environment variable not set")
             return
             
@@ -140,28 +171,27 @@ def trigger_ai_analysis():
             
         with st.spinner("🤖 Generating AI analysis and recommendations..."):
             # Initialize AI engine
-            if 'ai_engine' not in st.session_state:
-                try:
-                    st.session_state.ai_engine = PortfolioAIEngine(api_key=api_key)
-                except Exception as e:
-                    st.error(f"❌ Failed to initialize AI engine: {str(e)}")
-                    return
+            try:
+                engine = get_ai_engine(api_key)
+            except Exception as e:
+                st.error(f"❌ Failed to initialize AI engine: {str(e)}")
+                return
             
-            # Prepare COMPLETE data for AI including raw holdings
-            processed_data = {
-                'portfolio_summary': st.session_state.portfolio_summary,
-                'holdings_data': st.session_state.holdings_data,
-                'performance_summary': st.session_state.performance_data,
-                'risk_summary': st.session_state.risk_data,
-                'top_holdings': st.session_state.holdings_data.get('top_holdings', []),
-                'sector_allocation': st.session_state.holdings_data.get('sector_allocation', {}),
-                # Add raw holdings dataframe data
-                'raw_holdings_df': st.session_state.data_processor.get_raw_data('Holdings_Detail').to_dict('records') if 'data_processor' in st.session_state else []
-            }
+            # Prepare data for AI: summaries, sector aggregates and the largest holdings
+            processed_data = build_ai_payload()
             
-            # Generate analysis and recommendations
-            st.session_state.ai_analysis = st.session_state.ai_engine.analyze_portfolio(processed_data)
-            st.session_state.ai_recommendations = st.session_state.ai_engine.generate_recommendations(processed_data)
+            # Generate analysis and recommendations (the two Gemini calls run concurrently);
+            # results are cached per uploaded file, so repeat triggers skip the round-trips.
+            # An explicit regenerate drops this file's cached entry first
+            ai_args = (st.session_state.get('last_processed_file'), engine, processed_data, regenerate)
+            if regenerate:
+                _cached_ai_results.clear(*ai_args)
+            analysis, recommendations = _cached_ai_results(*ai_args)
+            # A cache hit skips the engine, so seed this session's vector store explicitly
+            engine.index_snapshot(processed_data)
+            st.session_state.ai_analysis = analysis
+            st.session_state.ai_recommendations = recommendations
+            st.session_state.ai_recommendations_by_priority = group_recommendations_by_priority(recommendations)
             st.session_state.ai_analysis_done = True
             
             st.success("✅ AI analysis completed successfully!")
@@ -170,47 +200,74 @@ def trigger_ai_analysis():
         st.error(f"❌ Error generating AI analysis: {str(e)}")
         st.exception(e)  # Show full traceback for debugging
 
+@st.cache_data(show_spinner=False)
+def _parse_portfolio(file_hash: str, _uploaded_file) -> dict:
+    """Parse an uploaded workbook; cached on its content hash, so reruns and re-uploads skip the Excel read"""
+    # UploadedFile is already an in-memory BytesIO, so the workbook is read from it directly
+    _uploaded_file.seek(0)
+    processor = PortfolioDataProcessor()
+    sheets = processor.load_excel_file(_uploaded_file)
+    
+    return {
+        'sheets': sheets,
+        'processed_data': processor.processed_data,
+        'portfolio_summary': processor.get_portfolio_summary(),
+        'holdings_data': processor.get_holdings_data(),
+        'performance_data': processor.get_performance_data(),
+        'risk_data': processor.get_risk_data(),
+    }
+
 def process_uploaded_file(uploaded_file):
     """Process the uploaded Excel file"""
     
-    # Check if this file was already processed
-    file_hash = str(hash(uploaded_file.name + str(uploaded_file.size)))
+    # Check if this file was already processed (content hash, so same-size files don't collide)
+    file_hash = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
     
     if st.session_state.get('last_processed_file') == file_hash and st.session_state.get('data_loaded', False):
         return  # Skip processing if same file already loaded
     
     try:
         with st.spinner("🔄 Processing portfolio data..."):
-            # Save uploaded file temporarily
-            temp_path = f"temp_{uploaded_file.name}"
-            with open(temp_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            
-            # Initialize data processor
-            if 'data_processor' not in st.session_state:
-                st.session_state.data_processor = PortfolioDataProcessor()
-            
             # Load and process data
-            data = st.session_state.data_processor.load_excel_file(temp_path)
+            parsed = _parse_portfolio(file_hash, uploaded_file)
+            
+            # Processor over the cached sheets, for the chart and holdings views
+            st.session_state.data_processor = PortfolioDataProcessor()
+            st.session_state.data_processor.load_sheets(parsed['sheets'], parsed['processed_data'])
             
             # Store processed data in session state
-            st.session_state.raw_data = data
-            st.session_state.portfolio_summary = st.session_state.data_processor.get_portfolio_summary()
-            st.session_state.holdings_data = st.session_state.data_processor.get_holdings_data()
-            st.session_state.performance_data = st.session_state.data_processor.get_performance_data()
-            st.session_state.risk_data = st.session_state.data_processor.get_risk_data()
+            st.session_state.raw_data = parsed['sheets']
+            st.session_state.portfolio_summary = parsed['portfolio_summary']
+            st.session_state.holdings_data = parsed['holdings_data']
+            st.session_state.performance_data = parsed['performance_data']
+            st.session_state.risk_data = parsed['risk_data']
+            # Only the largest holdings go to the model (sector totals and counts cover the rest);
+            # the engine formats them straight from the DataFrame
+            st.session_state.ai_holdings_df = st.session_state.data_processor.get_ai_holdings()
+            
+            # Chart and table inputs, sliced once per upload instead of on every rerun
+            processor = st.session_state.data_processor
+            perf = processor.get_time_series_data('Historical_Performance')
+            st.session_state.ts_perf = perf.astype(
+                {col: 'float32' for col in CHART_FLOAT32_COLUMNS if col in perf.columns}
+            )
+            st.session_state.ts_perf_overview = st.session_state.ts_perf[
+                ['Date'] + [col for col in ('Portfolio_Value', 'Cumulative_Return') if col in perf.columns]
+            ]
+            st.session_state.ts_bench = processor.get_time_series_data('Benchmarks')
+            risk = processor.get_time_series_data('Risk_Metrics')
+            st.session_state.ts_risk = risk.astype(
+                {col: 'float32' for col in CHART_FLOAT32_COLUMNS if col in risk.columns}
+            )
+            st.session_state.raw_holdings = processor.get_raw_data('Holdings_Detail')
             st.session_state.data_loaded = True
             st.session_state.last_processed_file = file_hash
             st.session_state.ai_analysis_done = False  # Reset AI analysis flag
             
-            # Clean up temp file
-            os.remove(temp_path)
-            
             st.success("✅ Portfolio data loaded successfully!")
             
             # Automatically trigger AI analysis if API key is available
-            api_key = os.getenv('GEMINI_API_KEY')
-            if api_key:
+            if _has_api_key():
                 trigger_ai_analysis()
             
     except Exception as e:
@@ -249,25 +306,17 @@ def display_welcome_screen():
 def display_dashboard():
     """Display the main portfolio dashboard"""
     
-    # Create tabs for different sections
-    tab1, tab2, tab3, tab4 = st.tabs([
-        "📊 Dashboard", 
-        "📈 Performance", 
-        "🎯 Holdings", 
-        "🤖 AI Recommendations"
-    ])
-    
-    with tab1:
-        display_overview_dashboard()
-    
-    with tab2:
-        display_performance_section()
-    
-    with tab3:
-        display_holdings_section()
+    # Section picker instead of st.tabs: tabs build every section on each rerun even though only
+    # one is visible, the radio lets us render just the selected one. Keyed so it survives reruns
+    section = st.radio(
+        "Section",
+        list(DASHBOARD_SECTIONS),
+        horizontal=True,
+        label_visibility="collapsed",
+        key="active_tab"
+    )
     
-    with tab4:
-        display_recommendations_section()
+    DASHBOARD_SECTIONS[section]()
 
 def display_overview_dashboard():
     """Display the main overview dashboard"""
@@ -286,23 +335,16 @@ def display_overview_dashboard():
     
     with col1:
         st.markdown("### 📊 Quick Performance Snapshot")
-        render_performance_charts(
-            st.session_state.data_processor.get_time_series_data(
-                'Historical_Performance', 
-                ['Portfolio_Value', 'Cumulative_Return']
-            ),
-            chart_type='overview'
-        )
+        render_performance_charts(st.session_state.ts_perf_overview, chart_type='overview')
     
     with col2:
         st.markdown("### 🎯 Top Holdings")
-        top_holdings = st.session_state.holdings_data.get('top_holdings', [])[:5]
-        if top_holdings:
-            holdings_df = pd.DataFrame(top_holdings)
+        holdings_df = st.session_state.holdings_data.get('top_holdings_df', pd.DataFrame()).head(5)
+        if not holdings_df.empty:
             st.dataframe(
-                holdings_df[['Asset_Name', 'Weight_Percent', 'Market_Value']].style.format({
-                    'Weight_Percent': '{:.2%}',
-                    'Market_Value': '₹{:,.0f}'
+                holdings_df[['Asset_Name', 'Weight_Percent_fmt', 'Market_Value_fmt']].rename(columns={
+                    'Weight_Percent_fmt': 'Weight_Percent',
+                    'Market_Value_fmt': 'Market_Value'
                 }),
                 use_container_width=True,
                 hide_index=True
@@ -315,15 +357,15 @@ def display_performance_section():
     
     # Performance charts
     render_performance_charts(
-        st.session_state.data_processor.get_time_series_data('Historical_Performance'),
-        st.session_state.data_processor.get_time_series_data('Benchmarks'),
+        st.session_state.ts_perf,
+        st.session_state.ts_bench,
         chart_type='detailed'
     )
     
     # Risk dashboard
     st.markdown("### ⚠️ Risk Analysis")
     render_risk_dashboard(
-        st.session_state.data_processor.get_time_series_data('Risk_Metrics'),
+        st.session_state.ts_risk,
         st.session_state.risk_data
     )
 
@@ -334,7 +376,7 @@ def display_holdings_section():
     
     render_holdings_analysis(
         st.session_state.holdings_data,
-        st.session_state.data_processor.get_raw_data('Holdings_Detail')
+        st.session_state.raw_holdings
     )
 
 def display_recommendations_section():
@@ -343,7 +385,10 @@ def display_recommendations_section():
     st.markdown("### 🤖 AI Investment Recommendations")
     
     if 'ai_recommendations' in st.session_state:
-        render_recommendations_section(st.session_state.ai_recommendations)
+        render_recommendations_section(
+            st.session_state.ai_recommendations,
+            st.session_state.get('ai_recommendations_by_priority')
+        )
     else:
         st.info("🔑 Please provide Gemini API key in the sidebar to enable AI recommendations")
     
@@ -353,6 +398,13 @@ def display_recommendations_section():
         with st.expander("View AI Analysis", expanded=True):
             st.markdown(st.session_state.ai_analysis.get('analysis', 'No analysis available'))
 
+DASHBOARD_SECTIONS = {
+    "📊 Dashboard": display_overview_dashboard,
+    "📈 Performance": display_performance_section,
+    "🎯 Holdings": display_holdings_section,
+    "🤖 AI Recommendations": display_recommendations_section,
+}
+
 if __name__ == "__main__":
     main()
     
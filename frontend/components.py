@@ -1,11 +1,64 @@
 import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
+import plotly.io as pio
 from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from utils import format_currency, format_percentage
+from utils import build_ai_payload, format_currency, format_percentage
+
+# st.plotly_chart serializes every figure through plotly.io.to_json; orjson (a pinned dependency)
+# encodes numpy arrays natively instead of via the pure-Python json encoder
+pio.json.config.default_engine = 'orjson'
+
+# Line traces above this many points are downsampled before they reach plotly; a chart is
+# only ~1-2k pixels wide, so extra points cost serialization and browser time without showing
+MAX_CHART_POINTS = 2000
+
+def _downsample(x, y, threshold=MAX_CHART_POINTS):
+    """Largest-Triangle-Three-Buckets downsampling of a line series, returns (x, y) arrays.
+    Keeps the first and last point, plus the most visually significant point of each bucket"""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(y)
+    if n <= threshold or threshold < 3:
+        return x, y
+    
+    # Triangle areas need numeric x; NaNs are scored as 0 so gaps don't poison a bucket
+    xs = x.astype('datetime64[ns]').astype(np.int64).astype(np.float64) if x.dtype.kind == 'M' else x.astype(np.float64)
+    ys = np.nan_to_num(y.astype(np.float64))
+    
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = xs[end:next_end].mean()
+        avg_y = ys[end:next_end].mean()
+        areas = np.abs(
+            (xs[a] - avg_x) * (ys[start:end] - ys[a]) - (xs[a] - xs[start:end]) * (avg_y - ys[a])
+        )
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    
+    return x[selected], y[selected]
+
+# Overview card markup, styled by .metric-card in load_custom_css
+_METRIC_CARD = '<div class="metric-card"><h4>{title}</h4><h2{style}>{value}</h2><p>{caption}</p></div>'
+_RISK_LEVEL_COLORS = {"Low": "green", "Moderate": "orange", "High": "red"}
+
+def _metric_card(title, value, caption, color=None):
+    """HTML for one overview card; without a color the value keeps the stylesheet's"""
+    return _METRIC_CARD.format_map({
+        'title': title,
+        'style': f' style="color: {color}"' if color else '',
+        'value': value,
+        'caption': caption
+    })
 
 def render_portfolio_overview(portfolio_summary, performance_data, risk_data):
     """Render portfolio overview cards and key metrics"""
@@ -14,58 +67,161 @@ def render_portfolio_overview(portfolio_summary, performance_data, risk_data):
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.markdown("""
-            <div class="metric-card">
-                <h4>💰 Total AUM</h4>
-                <h2>{}</h2>
-                <p>{}</p>
-            </div>
-        """.format(
+        st.markdown(_metric_card(
+            '💰 Total AUM',
             format_currency(portfolio_summary.get('total_aum', 0)),
             portfolio_summary.get('base_currency', 'INR')
         ), unsafe_allow_html=True)
     
     with col2:
         total_return = performance_data.get('total_return', 0)
-        return_color = "green" if total_return >= 0 else "red"
-        st.markdown("""
-            <div class="metric-card">
-                <h4>📈 Total Return</h4>
-                <h2 style="color: {}">{}</h2>
-                <p>vs Target: {}</p>
-            </div>
-        """.format(
-            return_color,
+        st.markdown(_metric_card(
+            '📈 Total Return',
             format_percentage(total_return),
-            format_percentage(portfolio_summary.get('target_return', 0))
+            f"vs Target: {format_percentage(portfolio_summary.get('target_return', 0))}",
+            "green" if total_return >= 0 else "red"
         ), unsafe_allow_html=True)
     
     with col3:
         sharpe_ratio = performance_data.get('sharpe_ratio', 0)
-        sharpe_color = "green" if sharpe_ratio > 1 else "orange" if sharpe_ratio > 0.5 else "red"
-        st.markdown("""
-            <div class="metric-card">
-                <h4>⚡ Sharpe Ratio</h4>
-                <h2 style="color: {}">{:.2f}</h2>
-                <p>Risk-Adj. Return</p>
-            </div>
-        """.format(sharpe_color, sharpe_ratio), unsafe_allow_html=True)
+        st.markdown(_metric_card(
+            '⚡ Sharpe Ratio',
+            f"{sharpe_ratio:.2f}",
+            'Risk-Adj. Return',
+            "green" if sharpe_ratio > 1 else "orange" if sharpe_ratio > 0.5 else "red"
+        ), unsafe_allow_html=True)
     
     with col4:
         risk_level = portfolio_summary.get('risk_level', 'Unknown')
-        risk_color = {"Low": "green", "Moderate": "orange", "High": "red"}.get(risk_level, "gray")
-        st.markdown("""
-            <div class="metric-card">
-                <h4>⚠️ Risk Level</h4>
-                <h2 style="color: {}">{}</h2>
-                <p>Beta: {:.2f}</p>
-            </div>
-        """.format(
-            risk_color,
+        st.markdown(_metric_card(
+            '⚠️ Risk Level',
             risk_level,
-            risk_data.get('portfolio_beta', 0)
+            f"Beta: {risk_data.get('portfolio_beta', 0):.2f}",
+            _RISK_LEVEL_COLORS.get(risk_level, "gray")
         ), unsafe_allow_html=True)
 
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_value_fig(historical_data):
+    """Portfolio value line chart for the overview"""
+    fig = go.Figure()
+    
+    x, y = _downsample(historical_data['Date'].to_numpy(), historical_data['Portfolio_Value'].to_numpy())
+    fig.add_trace(go.Scattergl(
+        x=x,
+        y=y,
+        mode='lines',
+        name='Portfolio Value',
+        line=dict(color='#1f77b4', width=3)
+    ))
+    
+    fig.update_layout(
+        title="Portfolio Value Over Time",
+        xaxis_title="Date",
+        yaxis_title="Portfolio Value (₹)",
+        height=300,
+        showlegend=False
+    )
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_performance_detail_fig(historical_data):
+    """Cumulative return vs benchmark on the left, rolling volatility over Sharpe ratio on the right,
+    as one figure so the pair costs a single layout and JSON payload"""
+    fig = make_subplots(
+        rows=2, cols=2,
+        specs=[[{"rowspan": 2}, {}], [None, {}]],
+        subplot_titles=('Cumulative Returns vs Benchmark', 'Rolling Volatility', 'Sharpe Ratio'),
+        vertical_spacing=0.1
+    )
+    
+    # Plain ndarrays, pulled once; the benchmark NaN check then runs on the raw buffer
+    dates = historical_data['Date'].to_numpy()
+    bench = historical_data['Benchmark_Return'].to_numpy()
+    
+    x, y = _downsample(dates, historical_data['Cumulative_Return'].to_numpy())
+    fig.add_trace(
+        go.Scattergl(
+            x=x,
+            y=y * 100,
+            mode='lines',
+            name='Portfolio Return',
+            line=dict(color='#1f77b4', width=2)
+        ),
+        row=1, col=1
+    )
+    
+    if not np.isnan(bench).all():
+        x, y = _downsample(dates, bench)
+        fig.add_trace(
+            go.Scattergl(
+                x=x,
+                y=y * 100,
+                mode='lines',
+                name='Benchmark Return',
+                line=dict(color='#ff7f0e', width=2, dash='dash')
+            ),
+            row=1, col=1
+        )
+    
+    x, y = _downsample(dates, historical_data['Volatility'].to_numpy())
+    fig.add_trace(
+        go.Scattergl(
+            x=x,
+            y=y * 100,
+            mode='lines',
+            name='Volatility',
+            line=dict(color='red', width=2),
+            showlegend=False
+        ),
+        row=1, col=2
+    )
+    
+    x, y = _downsample(dates, historical_data['Sharpe_Ratio'].to_numpy())
+    fig.add_trace(
+        go.Scattergl(
+            x=x,
+            y=y,
+            mode='lines',
+            name='Sharpe Ratio',
+            line=dict(color='green', width=2),
+            showlegend=False
+        ),
+        row=2, col=2
+    )
+    
+    fig.update_layout(
+        height=400,
+        legend=dict(orientation='h', x=0, y=-0.1)
+    )
+    fig.update_yaxes(title_text="Return (%)", row=1, col=1)
+    fig.update_yaxes(title_text="Volatility (%)", row=1, col=2)
+    fig.update_yaxes(title_text="Sharpe Ratio", row=2, col=2)
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_returns_hist_fig(historical_data):
+    """Histogram of daily returns, binned here so only the 30 bar heights reach the browser"""
+    fig = go.Figure()
+    
+    daily = historical_data['Daily_Return'].to_numpy(dtype='float64') * 100
+    counts, edges = np.histogram(daily[~np.isnan(daily)], bins=30)
+    fig.add_trace(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=edges[1] - edges[0],
+        name='Daily Returns',
+        marker_color='skyblue',
+        opacity=0.7
+    ))
+    
+    fig.update_layout(
+        title="Distribution of Daily Returns",
+        xaxis_title="Daily Return (%)",
+        yaxis_title="Frequency",
+        height=300
+    )
+    return fig
+
 def render_performance_charts(historical_data, benchmark_data=None, chart_type='overview'):
     """Render performance charts"""
     
@@ -75,123 +231,77 @@ def render_performance_charts(historical_data, benchmark_data=None, chart_type='
     
     if chart_type == 'overview':
         # Simple portfolio value chart
-        fig = go.Figure()
-        
-        fig.add_trace(go.Scatter(
-            x=historical_data['Date'],
-            y=historical_data['Portfolio_Value'],
-            mode='lines',
-            name='Portfolio Value',
-            line=dict(color='#1f77b4', width=3)
-        ))
-        
-        fig.update_layout(
-            title="Portfolio Value Over Time",
-            xaxis_title="Date",
-            yaxis_title="Portfolio Value (₹)",
-            height=300,
-            showlegend=False
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(_build_value_fig(historical_data), use_container_width=True)
     
     else:
         # Detailed performance analysis
         
-        # Performance vs Benchmark
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            fig = make_subplots(specs=[[{"secondary_y": True}]])
-            
-            fig.add_trace(
-                go.Scatter(
-                    x=historical_data['Date'],
-                    y=historical_data['Cumulative_Return'] * 100,
-                    mode='lines',
-                    name='Portfolio Return',
-                    line=dict(color='#1f77b4', width=2)
-                ),
-                secondary_y=False,
-            )
-            
-            if not historical_data['Benchmark_Return'].isna().all():
-                fig.add_trace(
-                    go.Scatter(
-                        x=historical_data['Date'],
-                        y=historical_data['Benchmark_Return'] * 100,
-                        mode='lines',
-                        name='Benchmark Return',
-                        line=dict(color='#ff7f0e', width=2, dash='dash')
-                    ),
-                    secondary_y=False,
-                )
-            
-            fig.update_layout(
-                title="Cumulative Returns vs Benchmark",
-                height=400
-            )
-            fig.update_yaxes(title_text="Return (%)", secondary_y=False)
-            
-            st.plotly_chart(fig, use_container_width=True)
-        
-        with col2:
-            # Volatility and Sharpe Ratio
-            fig = make_subplots(
-                rows=2, cols=1,
-                subplot_titles=('Rolling Volatility', 'Sharpe Ratio'),
-                vertical_spacing=0.1
-            )
-            
-            fig.add_trace(
-                go.Scatter(
-                    x=historical_data['Date'],
-                    y=historical_data['Volatility'] * 100,
-                    mode='lines',
-                    name='Volatility',
-                    line=dict(color='red', width=2)
-                ),
-                row=1, col=1
-            )
-            
-            fig.add_trace(
-                go.Scatter(
-                    x=historical_data['Date'],
-                    y=historical_data['Sharpe_Ratio'],
-                    mode='lines',
-                    name='Sharpe Ratio',
-                    line=dict(color='green', width=2)
-                ),
-                row=2, col=1
-            )
-            
-            fig.update_layout(height=400, showlegend=False)
-            fig.update_yaxes(title_text="Volatility (%)", row=1, col=1)
-            fig.update_yaxes(title_text="Sharpe Ratio", row=2, col=1)
-            
-            st.plotly_chart(fig, use_container_width=True)
+        # Performance vs Benchmark, with volatility and Sharpe ratio alongside
+        st.plotly_chart(_build_performance_detail_fig(historical_data), use_container_width=True)
         
-        # Daily returns distribution
+        # Daily returns distribution; an expander would still build and send the figure while
+        # collapsed, so the panel sits behind a toggle and costs nothing until switched on
         st.markdown("#### 📊 Daily Returns Distribution")
         
-        fig = go.Figure()
-        
-        fig.add_trace(go.Histogram(
-            x=historical_data['Daily_Return'] * 100,
-            nbinsx=30,
-            name='Daily Returns',
-            marker_color='skyblue',
-            opacity=0.7
-        ))
-        
-        fig.update_layout(
-            title="Distribution of Daily Returns",
-            xaxis_title="Daily Return (%)",
-            yaxis_title="Frequency",
-            height=300
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        if st.toggle("Show distribution", key="show_returns_distribution"):
+            st.plotly_chart(_build_returns_hist_fig(historical_data), use_container_width=True)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_sector_pie_fig(sector_allocation):
+    """Sector allocation pie chart"""
+    fig = px.pie(
+        values=list(sector_allocation.values()),
+        names=list(sector_allocation.keys()),
+        title="Sector Allocation",
+        color_discrete_sequence=px.colors.qualitative.Set3
+    )
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    fig.update_layout(height=400)
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_top_holdings_fig(top_holdings_df):
+    """Horizontal bar chart of the largest holdings by weight"""
+    fig = px.bar(
+        top_holdings_df,
+        x='Weight_Percent',
+        y='Asset_Name',
+        orientation='h',
+        title="Top 10 Holdings by Weight",
+        color='Weight_Percent',
+        color_continuous_scale='Blues'
+    )
+    fig.update_layout(
+        height=400,
+        yaxis={'categoryorder': 'total ascending'}
+    )
+    fig.update_traces(texttemplate='%{x:.1%}', textposition='outside')
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_geo_pie_fig(geo_allocation):
+    """Market value by geography"""
+    fig = px.pie(
+        values=list(geo_allocation.values()),
+        names=list(geo_allocation.keys()),
+        title="Geographic Allocation"
+    )
+    fig.update_layout(height=300)
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_esg_bar_fig(esg_distribution):
+    """Holding counts per ESG rating"""
+    counts = list(esg_distribution.values())
+    fig = px.bar(
+        x=list(esg_distribution.keys()),
+        y=counts,
+        title="ESG Rating Distribution",
+        color=counts,
+        color_continuous_scale='RdYlGn'
+    )
+    fig.update_layout(height=300)
+    return fig
 
 def render_holdings_analysis(holdings_data, holdings_df):
     """Render holdings analysis charts and tables"""
@@ -202,94 +312,98 @@ def render_holdings_analysis(holdings_data, holdings_df):
         # Sector allocation pie chart
         sector_allocation = holdings_data.get('sector_allocation', {})
         if sector_allocation:
-            fig = px.pie(
-                values=list(sector_allocation.values()),
-                names=list(sector_allocation.keys()),
-                title="Sector Allocation",
-                color_discrete_sequence=px.colors.qualitative.Set3
-            )
-            fig.update_traces(textposition='inside', textinfo='percent+label')
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(_build_sector_pie_fig(sector_allocation), use_container_width=True)
     
     with col2:
         # Top holdings bar chart
-        top_holdings = holdings_data.get('top_holdings', [])[:10]
-        if top_holdings:
-            holdings_df_viz = pd.DataFrame(top_holdings)
-            
-            fig = px.bar(
-                holdings_df_viz,
-                x='Weight_Percent',
-                y='Asset_Name',
-                orientation='h',
-                title="Top 10 Holdings by Weight",
-                color='Weight_Percent',
-                color_continuous_scale='Blues'
-            )
-            fig.update_layout(
-                height=400,
-                yaxis={'categoryorder': 'total ascending'}
-            )
-            fig.update_traces(texttemplate='%{x:.1%}', textposition='outside')
-            st.plotly_chart(fig, use_container_width=True)
+        holdings_df_viz = holdings_data.get('top_holdings_df', pd.DataFrame()).head(10)
+        if not holdings_df_viz.empty:
+            st.plotly_chart(_build_top_holdings_fig(holdings_df_viz), use_container_width=True)
     
     # Holdings detail table
     st.markdown("#### 📋 Holdings Detail")
     
-    if not holdings_df.empty:
-        # Format the dataframe for display
-        display_df = holdings_df.copy()
-        display_df = display_df.sort_values('Market_Value', ascending=False)
-        
-        # Select key columns
-        columns_to_show = [
-            'Asset_Name', 'Ticker_Symbol', 'Sector', 'Weight_Percent',
-            'Market_Value', 'Current_Price', 'ESG_Rating', 'Dividend_Yield'
-        ]
-        
-        display_df = display_df[columns_to_show]
+    # Sorted and formatted once by the data processor, so no Styler pass per rerun
+    holdings_table = holdings_data.get('holdings_table', pd.DataFrame())
+    if not holdings_table.empty:
+        st.dataframe(holdings_table, use_container_width=True)
+    
+    # Geographic and ESG analysis, behind a toggle like the returns distribution
+    if st.toggle("🌍 Show geographic & ESG breakdown", key="show_geo_esg"):
+        col1, col2 = st.columns(2)
         
-        # Format columns
-        formatted_df = display_df.style.format({
-            'Weight_Percent': '{:.2%}',
-            'Market_Value': '₹{:,.0f}',
-            'Current_Price': '₹{:.2f}',
-            'Dividend_Yield': '{:.2%}'
-        })
+        with col1:
+            # Geographic allocation, aggregated once by the data processor
+            geo_allocation = holdings_data.get('geographic_allocation', {})
+            if geo_allocation:
+                st.plotly_chart(_build_geo_pie_fig(geo_allocation), use_container_width=True)
         
-        st.dataframe(formatted_df, use_container_width=True)
+        with col2:
+            # ESG rating distribution
+            esg_distribution = holdings_data.get('esg_distribution', {})
+            if esg_distribution:
+                st.plotly_chart(_build_esg_bar_fig(esg_distribution), use_container_width=True)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_var_fig(risk_data):
+    """VaR and CVaR over time"""
+    fig = go.Figure()
     
-    # Geographic and ESG analysis
-    col1, col2 = st.columns(2)
+    dates = risk_data['Date'].to_numpy()
     
-    with col1:
-        if not holdings_df.empty:
-            # Geographic allocation
-            geo_allocation = holdings_df.groupby('Geography')['Market_Value'].sum()
-            
-            fig = px.pie(
-                values=geo_allocation.values,
-                names=geo_allocation.index,
-                title="Geographic Allocation"
-            )
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
+    x, y = _downsample(dates, risk_data['VaR_95'].to_numpy())
+    fig.add_trace(go.Scattergl(
+        x=x,
+        y=y,
+        mode='lines',
+        name='VaR 95%',
+        line=dict(color='red', width=2),
+        fill='tonexty'
+    ))
     
-    with col2:
-        if not holdings_df.empty:
-            # ESG rating distribution
-            esg_counts = holdings_df['ESG_Rating'].value_counts()
-            
-            fig = px.bar(
-                x=esg_counts.index,
-                y=esg_counts.values,
-                title="ESG Rating Distribution",
-                color=esg_counts.values,
-                color_continuous_scale='RdYlGn'
-            )
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
+    x, y = _downsample(dates, risk_data['CVaR_95'].to_numpy())
+    fig.add_trace(go.Scattergl(
+        x=x,
+        y=y,
+        mode='lines',
+        name='CVaR 95%',
+        line=dict(color='darkred', width=2)
+    ))
+    
+    fig.update_layout(
+        title="Value at Risk (VaR) Analysis",
+        xaxis_title="Date",
+        yaxis_title="Risk Value (₹)",
+        height=400
+    )
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_beta_gauge_fig(beta):
+    """Portfolio beta gauge"""
+    fig = go.Figure(go.Indicator(
+        mode = "gauge+number+delta",
+        value = beta,
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        title = {'text': "Portfolio Beta"},
+        delta = {'reference': 1.0},
+        gauge = {
+            'axis': {'range': [None, 2]},
+            'bar': {'color': "darkblue"},
+            'steps': [
+                {'range': [0, 0.8], 'color': "lightgray"},
+                {'range': [0.8, 1.2], 'color': "gray"}
+            ],
+            'threshold': {
+                'line': {'color': "red", 'width': 4},
+                'thickness': 0.75,
+                'value': 1.5
+            }
+        }
+    ))
+    
+    fig.update_layout(height=400)
+    return fig
 
 def render_risk_dashboard(risk_data, risk_summary):
     """Render risk analysis dashboard"""
@@ -299,61 +413,13 @@ def render_risk_dashboard(risk_data, risk_summary):
     with col1:
         # VaR over time
         if not risk_data.empty:
-            fig = go.Figure()
-            
-            fig.add_trace(go.Scatter(
-                x=risk_data['Date'],
-                y=risk_data['VaR_95'],
-                mode='lines',
-                name='VaR 95%',
-                line=dict(color='red', width=2),
-                fill='tonexty'
-            ))
-            
-            fig.add_trace(go.Scatter(
-                x=risk_data['Date'],
-                y=risk_data['CVaR_95'],
-                mode='lines',
-                name='CVaR 95%',
-                line=dict(color='darkred', width=2)
-            ))
-            
-            fig.update_layout(
-                title="Value at Risk (VaR) Analysis",
-                xaxis_title="Date",
-                yaxis_title="Risk Value (₹)",
-                height=400
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(_build_var_fig(risk_data), use_container_width=True)
     
     with col2:
         # Risk metrics gauge
         beta = risk_summary.get('portfolio_beta', 1.0)
         
-        fig = go.Figure(go.Indicator(
-            mode = "gauge+number+delta",
-            value = beta,
-            domain = {'x': [0, 1], 'y': [0, 1]},
-            title = {'text': "Portfolio Beta"},
-            delta = {'reference': 1.0},
-            gauge = {
-                'axis': {'range': [None, 2]},
-                'bar': {'color': "darkblue"},
-                'steps': [
-                    {'range': [0, 0.8], 'color': "lightgray"},
-                    {'range': [0.8, 1.2], 'color': "gray"}
-                ],
-                'threshold': {
-                    'line': {'color': "red", 'width': 4},
-                    'thickness': 0.75,
-                    'value': 1.5
-                }
-            }
-        ))
-        
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(_build_beta_gauge_fig(beta), use_container_width=True)
     
     # Risk metrics summary table
     if risk_summary:
@@ -372,8 +438,18 @@ def render_risk_dashboard(risk_data, risk_summary):
         risk_df = pd.DataFrame(risk_metrics, columns=['Metric', 'Value'])
         st.dataframe(risk_df, use_container_width=True, hide_index=True)
 
-def render_recommendations_section(recommendations):
-    """Render AI recommendations in an organized format"""
+def group_recommendations_by_priority(recommendations):
+    """Bucket recommendations per priority filter option, in their original order"""
+    buckets = {"High": [], "Medium": [], "Low": []}
+    for rec in recommendations:
+        if rec.get('priority') in buckets:
+            buckets[rec['priority']].append(rec)
+    buckets["All"] = recommendations
+    return buckets
+
+def render_recommendations_section(recommendations, recommendations_by_priority=None):
+    """Render AI recommendations in an organized format; pass the group_recommendations_by_priority
+    buckets to skip regrouping on every filter change"""
     
     if not recommendations or len(recommendations) == 0:
         st.info("🔄 No recommendations generated yet. Try refreshing or check your AI analysis.")
@@ -388,9 +464,9 @@ def render_recommendations_section(recommendations):
         )
     
     # Filter recommendations
-    filtered_recs = recommendations
-    if priority_filter != "All":
-        filtered_recs = [rec for rec in recommendations if rec.get('priority') == priority_filter]
+    if recommendations_by_priority is None:
+        recommendations_by_priority = group_recommendations_by_priority(recommendations)
+    filtered_recs = recommendations_by_priority[priority_filter]
     
     if not filtered_recs:
         st.warning(f"No {priority_filter.lower()} priority recommendations found.")
@@ -424,19 +500,22 @@ def render_recommendations_section(recommendations):
                     </div>
                 """, unsafe_allow_html=True)
 
+# Suggested chat questions with their fixed widget keys
+SUGGESTED_QUESTIONS = tuple((question, f"suggest_{i}") for i, question in enumerate((
+    "What are the key risks in my portfolio?",
+    "How is my portfolio performing vs benchmark?",
+    "Which sectors should I consider reducing?",
+    "What are my top performing holdings?",
+    "How can I improve diversification?",
+    "Explain my portfolio in detail with specific numbers",
+    "What is my current ESG exposure?"
+)))
+
 def render_chat_interface(ai_engine):
     """Render the chat interface for portfolio Q&A"""
     
     # Get current processed data for context
-    processed_data = {
-        'portfolio_summary': st.session_state.get('portfolio_summary', {}),
-        'holdings_data': st.session_state.get('holdings_data', {}),
-        'performance_summary': st.session_state.get('performance_data', {}),
-        'risk_summary': st.session_state.get('risk_data', {}),
-        'top_holdings': st.session_state.get('holdings_data', {}).get('top_holdings', []),
-        'sector_allocation': st.session_state.get('holdings_data', {}).get('sector_allocation', {}),
-        'raw_holdings_df': st.session_state.get('data_processor').get_raw_data('Holdings_Detail').to_dict('records') if 'data_processor' in st.session_state else []
-    }
+    processed_data = build_ai_payload()
     
     # Initialize chat messages if not exists
     if 'chat_messages' not in st.session_state:
@@ -463,8 +542,8 @@ def render_chat_interface(ai_engine):
                     # Debug: Show what data is being sent
                     st.write("🔍 **Debug**: Processing your question with complete portfolio data...")
                     
-                    # Call the AI engine with complete data
-                    response = ai_engine.chat_with_portfolio(prompt, processed_data)
+                    # Call the AI engine with complete data, showing the answer as it streams in
+                    response = st.write_stream(ai_engine.stream_chat(prompt, processed_data))
                     
                     # Check if we got a meaningful response (not fallback)
                     if "I can provide information about portfolio performance" in response:
@@ -497,8 +576,6 @@ def render_chat_interface(ai_engine):
                                 st.error("AI engine method not available")
                         except Exception as e:
                             st.error(f"Direct AI call failed: {str(e)}")
-                    else:
-                        st.write(response)
                     
                     # Add assistant response to history
                     st.session_state.chat_messages.append({"role": "assistant", "content": response})
@@ -515,30 +592,29 @@ def render_chat_interface(ai_engine):
     with col1:
         if st.button("🧹 Clear Chat History"):
             st.session_state.chat_messages = []
+            st.session_state.pop('suggestion_answers', None)
             if hasattr(ai_engine, 'clear_chat_history'):
                 ai_engine.clear_chat_history()
             st.rerun()
         
     # Suggested questions
     with st.expander("💡 Suggested Questions"):
-        suggestions = [
-            "What are the key risks in my portfolio?",
-            "How is my portfolio performing vs benchmark?", 
-            "Which sectors should I consider reducing?",
-            "What are my top performing holdings?",
-            "How can I improve diversification?",
-            "Explain my portfolio in detail with specific numbers",
-            "What is my current ESG exposure?"
-        ]
+        # Answers per (question, uploaded file) for this session, so clicking the same suggestion
+        # again is a lookup instead of another model round-trip. Errors are not kept
+        answers = st.session_state.setdefault('suggestion_answers', {})
         
-        for suggestion in suggestions:
-            if st.button(suggestion, key=f"suggest_{hash(suggestion)}"):
+        for suggestion, button_key in SUGGESTED_QUESTIONS:
+            if st.button(suggestion, key=button_key):
                 # Add suggestion as user message
                 st.session_state.chat_messages.append({"role": "user", "content": suggestion})
                 
                 # Generate AI response
                 try:
-                    response = ai_engine.chat_with_portfolio(suggestion, processed_data)
+                    answer_key = (suggestion, st.session_state.get('last_processed_file'))
+                    response = answers.get(answer_key)
+                    if response is None:
+                        response = ai_engine.chat_with_portfolio(suggestion, processed_data)
+                        answers[answer_key] = response
                     st.session_state.chat_messages.append({"role": "assistant", "content": response})
                     st.rerun()
                 except Exception as e:
@@ -1,56 +1,70 @@
 import streamlit as st
-import pandas as pd
+import copy
+import io
+import math
+import re
+import time
+from functools import lru_cache
 import numpy as np
 from datetime import datetime
 from typing import Any, Dict, List
 
+# Session keys owned by the app (loaded portfolio, derived views, AI and chat state); widget state is not listed
+PORTFOLIO_STATE_KEYS = (
+    'data_loaded', 'raw_data', 'portfolio_summary', 'holdings_data', 'performance_data', 'risk_data',
+    'data_processor', 'raw_holdings', 'ai_holdings_df', 'ts_perf_overview', 'ts_perf', 'ts_bench', 'ts_risk',
+    'ai_engine', 'ai_analysis', 'ai_recommendations', 'ai_recommendations_by_priority', 'ai_analysis_done',
+    'chat_messages', 'suggestion_answers', 'last_processed_file',
+)
+
+def reset_portfolio_state():
+    """Drop the loaded portfolio and AI/chat state; initialize_session_state re-seeds the defaults on the next run"""
+    for key in PORTFOLIO_STATE_KEYS:
+        if key in st.session_state:
+            del st.session_state[key]
+
+# Session defaults seeded by initialize_session_state: data storage, AI components, processing control, API keys
+SESSION_DEFAULTS = {
+    'data_loaded': False,
+    'raw_data': {},
+    'portfolio_summary': {},
+    'holdings_data': {},
+    'performance_data': {},
+    'risk_data': {},
+    'ai_analysis': {},
+    'ai_recommendations': [],
+    'chat_messages': [],
+    'last_processed_file': None,
+    'ai_analysis_done': False,
+    'gemini_api_key': '',
+}
+
 def initialize_session_state():
     """Initialize session state variables"""
-    
-    # Data storage
-    if 'data_loaded' not in st.session_state:
-        st.session_state.data_loaded = False
-    
-    if 'raw_data' not in st.session_state:
-        st.session_state.raw_data = {}
-    
-    if 'portfolio_summary' not in st.session_state:
-        st.session_state.portfolio_summary = {}
-    
-    if 'holdings_data' not in st.session_state:
-        st.session_state.holdings_data = {}
-    
-    if 'performance_data' not in st.session_state:
-        st.session_state.performance_data = {}
-    
-    if 'risk_data' not in st.session_state:
-        st.session_state.risk_data = {}
-    
-    # AI components
-    if 'ai_analysis' not in st.session_state:
-        st.session_state.ai_analysis = {}
-    
-    if 'ai_recommendations' not in st.session_state:
-        st.session_state.ai_recommendations = []
-    
-    if 'chat_messages' not in st.session_state:
-        st.session_state.chat_messages = []
-    
-    # Processing control
-    if 'last_processed_file' not in st.session_state:
-        st.session_state.last_processed_file = None
-        
-    if 'ai_analysis_done' not in st.session_state:
-        st.session_state.ai_analysis_done = False
-    
-    # API keys
-    if 'gemini_api_key' not in st.session_state:
-        st.session_state.gemini_api_key = ''
+    for key, default in SESSION_DEFAULTS.items():
+        if key not in st.session_state:
+            # Each session gets its own containers, never the shared default objects
+            st.session_state[key] = copy.copy(default)
 
-def load_custom_css():
-    """Load custom CSS for styling"""
-    
-    st.markdown("""
+# Holdings aggregates the AI prompt reads; any other holdings_data entries (e.g. display views) stay
+# out of the payload, which the engine hashes on every analysis and chat turn
+AI_HOLDINGS_KEYS = ('total_holdings', 'sector_counts', 'geographic_allocation')
+
+def build_ai_payload() -> Dict[str, Any]:
+    """processed_data for the AI engine: summaries, holdings aggregates and the largest holdings"""
+    holdings = st.session_state.get('holdings_data', {})
+    return {
+        'portfolio_summary': st.session_state.get('portfolio_summary', {}),
+        'holdings_data': {key: holdings[key] for key in AI_HOLDINGS_KEYS if key in holdings},
+        'performance_summary': st.session_state.get('performance_data', {}),
+        'risk_summary': st.session_state.get('risk_data', {}),
+        'top_holdings': holdings.get('top_holdings', []),
+        'sector_allocation': holdings.get('sector_allocation', {}),
+        'raw_holdings_df': st.session_state.get('ai_holdings_df', [])
+    }
+
+# App stylesheet, injected by load_custom_css
+CUSTOM_CSS = """
         <style>
         /* Main header styling */
         .main-header {
@@ -284,42 +298,94 @@ def load_custom_css():
             background: #555;
         }
         </style>
-    """, unsafe_allow_html=True)
+"""
+
+def _minify_css(css: str) -> str:
+    """Drop comments and the whitespace around CSS punctuation; selectors keep their single spaces"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};:,>])\s*', r'\1', css).strip()
+
+# Sent on every run, so minified once at import: about half the bytes of the readable source
+_CUSTOM_CSS_MIN = _minify_css(CUSTOM_CSS)
+
+def load_custom_css():
+    """Load custom CSS for styling. Emitted on every run, not once per session: Streamlit
+    removes elements a rerun does not write again, so a one-shot injection would unstyle the app"""
+    
+    st.markdown(_CUSTOM_CSS_MIN, unsafe_allow_html=True)
+
+# Scaling buckets shared by format_currency and format_currency_array: below 1e3, then K, M, B and T
+_CURRENCY_THRESHOLDS = np.array([1e3, 1e6, 1e9, 1e12])
+_CURRENCY_BUCKET_SCALES = (1.0, 1e3, 1e6, 1e9, 1e12)
+_CURRENCY_SCALES = np.array(_CURRENCY_BUCKET_SCALES)
+_CURRENCY_FORMATS = ("{:,.2f}", "{:.2f}K", "{:.2f}M", "{:.2f}B", "{:.2f}T")
+
+@lru_cache(maxsize=16)
+def _currency_format(currency: str, bucket: int):
+    """Bound str.format with the currency prefix baked into the bucket's template"""
+    return (currency.replace('{', '{{').replace('}', '}}') + _CURRENCY_FORMATS[bucket]).format
 
 def format_currency(amount: float, currency: str = "₹") -> str:
     """Format currency values with appropriate scaling"""
     
-    if pd.isna(amount) or amount == 0:
+    if amount is None or amount != amount or amount == 0:
         return f"{currency}0"
     
     abs_amount = abs(amount)
     
-    if abs_amount >= 1e12:  # Trillion
-        return f"{currency}{amount/1e12:.2f}T"
-    elif abs_amount >= 1e9:  # Billion
-        return f"{currency}{amount/1e9:.2f}B"
-    elif abs_amount >= 1e6:  # Million
-        return f"{currency}{amount/1e6:.2f}M"
-    elif abs_amount >= 1e3:  # Thousand
-        return f"{currency}{amount/1e3:.2f}K"
+    # The bucket is the decimal exponent // 3 instead of a branch per power of 1000;
+    # the comparison undoes log10 rounding up to the next power just below it
+    if abs_amount < 1e3:
+        bucket = 0
+    elif abs_amount >= 1e12:
+        bucket = 4
     else:
-        return f"{currency}{amount:,.2f}"
+        bucket = int(math.log10(abs_amount)) // 3
+        if abs_amount < _CURRENCY_BUCKET_SCALES[bucket]:
+            bucket -= 1
+    
+    return _currency_format(currency, bucket)(amount / _CURRENCY_BUCKET_SCALES[bucket])
+
+def format_currency_array(amounts, currency: str = "₹") -> List[str]:
+    """format_currency over many values: the scaling bucket and division run once in NumPy,
+    leaving one format call per value. Returns the same strings as the scalar version"""
+    
+    amounts = np.asarray(amounts, dtype=np.float64)
+    buckets = np.searchsorted(_CURRENCY_THRESHOLDS, np.abs(amounts), side='right')
+    scaled = amounts / _CURRENCY_SCALES[buckets]
+    zero = f"{currency}0"
+    formats = [_currency_format(currency, bucket) for bucket in range(len(_CURRENCY_FORMATS))]
+    return [
+        zero if amount != amount or amount == 0 else formats[bucket](value)
+        for amount, bucket, value in zip(amounts.tolist(), buckets.tolist(), scaled.tolist())
+    ]
+
+# Bound str.format per precision, so the nested format spec is not rebuilt on every call
+@lru_cache(maxsize=8)
+def _percentage_format(decimals: int):
+    return f"{{:.{decimals}f}}%".format
+
+@lru_cache(maxsize=8)
+def _number_format(decimals: int):
+    return f"{{:,.{decimals}f}}".format
 
 def format_percentage(value: float, decimals: int = 2) -> str:
     """Format percentage values"""
     
-    if pd.isna(value):
+    # value != value is the scalar NaN test, without a pd.isna dispatch
+    if value is None or value != value:
         return "N/A"
     
-    return f"{value * 100:.{decimals}f}%"
+    return _percentage_format(decimals)(value * 100)
 
 def format_number(value: float, decimals: int = 2) -> str:
     """Format numerical values with comma separators"""
     
-    if pd.isna(value):
+    if value is None or value != value:
         return "N/A"
     
-    return f"{value:,.{decimals}f}"
+    return _number_format(decimals)(value)
 
 def calculate_portfolio_metrics(data: Dict[str, Any]) -> Dict[str, Any]:
     """Calculate additional portfolio metrics"""
@@ -352,21 +418,20 @@ def calculate_portfolio_metrics(data: Dict[str, Any]) -> Dict[str, Any]:
         top_holdings = holdings.get('top_holdings', [])
         
         if top_holdings:
-            # Top 5 concentration
-            top_5_weights = sum([h.get('Weight_Percent', 0) for h in top_holdings[:5]])
-            metrics['top_5_concentration'] = top_5_weights
-            
-            # Top 10 concentration
-            top_10_weights = sum([h.get('Weight_Percent', 0) for h in top_holdings[:10]])
-            metrics['top_10_concentration'] = top_10_weights
+            # Top 5 and top 10 concentration from one weights array
+            n_top = min(10, len(top_holdings))
+            weights = np.fromiter((h.get('Weight_Percent', 0) for h in top_holdings[:n_top]),
+                                  dtype=np.float64, count=n_top)
+            metrics['top_5_concentration'] = float(weights[:5].sum())
+            metrics['top_10_concentration'] = float(weights.sum())
             
             # Herfindahl index for sector concentration
             sector_allocation = holdings.get('sector_allocation', {})
             if sector_allocation:
-                total_value = sum(sector_allocation.values())
+                values = np.fromiter(sector_allocation.values(), dtype=np.float64, count=len(sector_allocation))
+                total_value = values.sum()
                 if total_value > 0:
-                    herfindahl = sum((value / total_value) ** 2 for value in sector_allocation.values())
-                    metrics['sector_herfindahl'] = herfindahl
+                    metrics['sector_herfindahl'] = float(np.square(values / total_value).sum())
     
     return metrics
 
@@ -406,110 +471,112 @@ def validate_data_completeness(data: Dict[str, Any]) -> Dict[str, bool]:
     
     return validation
 
+# Alert rules checked in order: (section, field, breach test, type, title, message builder).
+# A rule only applies when its section is present; a missing field reads as 0
+_ALERT_RULES = (
+    ('performance_summary', 'total_return', lambda v: v < -0.05,  # -5% return
+     'warning', 'Poor Performance',
+     lambda v: f'Portfolio showing negative return of {format_percentage(v)}'),
+    ('performance_summary', 'sharpe_ratio', lambda v: v < 0.5,
+     'warning', 'Low Risk-Adjusted Returns',
+     lambda v: f'Sharpe ratio of {v:.2f} indicates poor risk-adjusted performance'),
+    ('risk_summary', 'concentration_risk', lambda v: v > 0.4,
+     'error', 'High Concentration Risk',
+     lambda v: f'Concentration risk of {v:.1%} exceeds recommended levels'),
+    ('risk_summary', 'var_95', lambda v: v < -50000000,  # -50M threshold
+     'warning', 'High Value at Risk',
+     lambda v: f'VaR (95%) of {format_currency(v)} indicates high potential losses'),
+    ('holdings_data', 'total_holdings', lambda v: v < 10,
+     'info', 'Limited Diversification',
+     lambda v: f'Only {v} holdings may limit diversification benefits'),
+)
+
 def generate_alerts(data: Dict[str, Any]) -> List[Dict[str, str]]:
     """Generate portfolio alerts based on data analysis"""
     
     alerts = []
     
-    # Performance alerts
-    if 'performance_summary' in data:
-        perf = data['performance_summary']
+    for section, field, breached, alert_type, title, message in _ALERT_RULES:
+        if section not in data:
+            continue
         
-        total_return = perf.get('total_return', 0)
-        if total_return < -0.05:  # -5% return
+        value = data[section].get(field, 0)
+        if breached(value):
             alerts.append({
-                'type': 'warning',
-                'title': 'Poor Performance',
-                'message': f'Portfolio showing negative return of {format_percentage(total_return)}'
-            })
-        
-        sharpe_ratio = perf.get('sharpe_ratio', 0)
-        if sharpe_ratio < 0.5:
-            alerts.append({
-                'type': 'warning',
-                'title': 'Low Risk-Adjusted Returns',
-                'message': f'Sharpe ratio of {sharpe_ratio:.2f} indicates poor risk-adjusted performance'
-            })
-    
-    # Risk alerts
-    if 'risk_summary' in data:
-        risk = data['risk_summary']
-        
-        concentration_risk = risk.get('concentration_risk', 0)
-        if concentration_risk > 0.4:
-            alerts.append({
-                'type': 'error',
-                'title': 'High Concentration Risk',
-                'message': f'Concentration risk of {concentration_risk:.1%} exceeds recommended levels'
-            })
-        
-        var_95 = risk.get('var_95', 0)
-        if var_95 < -50000000:  # -50M threshold
-            alerts.append({
-                'type': 'warning',
-                'title': 'High Value at Risk',
-                'message': f'VaR (95%) of {format_currency(var_95)} indicates high potential losses'
-            })
-    
-    # Holdings alerts
-    if 'holdings_data' in data:
-        holdings = data['holdings_data']
-        total_holdings = holdings.get('total_holdings', 0)
-        
-        if total_holdings < 10:
-            alerts.append({
-                'type': 'info',
-                'title': 'Limited Diversification',
-                'message': f'Only {total_holdings} holdings may limit diversification benefits'
+                'type': alert_type,
+                'title': title,
+                'message': message(value)
             })
     
     return alerts
 
+# Section rules of export_portfolio_report
+_REPORT_TITLE_RULE = "=" * 50 + "\n"
+_REPORT_SECTION_RULE = "-" * 20 + "\n"
+
+@lru_cache(maxsize=1)
+def _report_timestamp(second: int) -> str:
+    """The report's Generated: stamp, formatted once per wall-clock second"""
+    return datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
+
+# Row layout of the TOP 10 HOLDINGS block in export_portfolio_report
+_REPORT_HOLDING_LINE_FMT = "{:2d}. {:<30} {:>8} {:>12}\n".format
+
 def export_portfolio_report(data: Dict[str, Any]) -> str:
     """Generate a formatted portfolio report for export"""
     
-    report_lines = []
+    # One write per section rather than an append per line; every line ends in "\n"
+    buf = io.StringIO()
+    write = buf.write
     
     # Header
-    report_lines.append("SOVEREIGN FUND PORTFOLIO REPORT")
-    report_lines.append("=" * 50)
-    report_lines.append(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    report_lines.append("")
+    write(
+        "SOVEREIGN FUND PORTFOLIO REPORT\n"
+        f"{_REPORT_TITLE_RULE}"
+        f"Generated: {_report_timestamp(int(time.time()))}\n"
+        "\n"
+    )
     
     # Portfolio summary
     if 'portfolio_summary' in data:
         portfolio = data['portfolio_summary']
-        report_lines.append("PORTFOLIO OVERVIEW")
-        report_lines.append("-" * 20)
-        report_lines.append(f"Fund Name: {portfolio.get('fund_name', 'Unknown')}")
-        report_lines.append(f"Total AUM: {format_currency(portfolio.get('total_aum', 0))}")
-        report_lines.append(f"Base Currency: {portfolio.get('base_currency', 'Unknown')}")
-        report_lines.append(f"Risk Level: {portfolio.get('risk_level', 'Unknown')}")
-        report_lines.append(f"Target Return: {format_percentage(portfolio.get('target_return', 0))}")
-        report_lines.append("")
+        write(
+            "PORTFOLIO OVERVIEW\n"
+            f"{_REPORT_SECTION_RULE}"
+            f"Fund Name: {portfolio.get('fund_name', 'Unknown')}\n"
+            f"Total AUM: {format_currency(portfolio.get('total_aum', 0))}\n"
+            f"Base Currency: {portfolio.get('base_currency', 'Unknown')}\n"
+            f"Risk Level: {portfolio.get('risk_level', 'Unknown')}\n"
+            f"Target Return: {format_percentage(portfolio.get('target_return', 0))}\n"
+            "\n"
+        )
     
     # Performance summary
     if 'performance_summary' in data:
         perf = data['performance_summary']
-        report_lines.append("PERFORMANCE METRICS")
-        report_lines.append("-" * 20)
-        report_lines.append(f"Total Return: {format_percentage(perf.get('total_return', 0))}")
-        report_lines.append(f"Daily Return: {format_percentage(perf.get('daily_return', 0))}")
-        report_lines.append(f"Volatility: {format_percentage(perf.get('volatility', 0))}")
-        report_lines.append(f"Sharpe Ratio: {perf.get('sharpe_ratio', 0):.2f}")
-        report_lines.append(f"Max Drawdown: {format_percentage(perf.get('max_drawdown', 0))}")
-        report_lines.append("")
+        write(
+            "PERFORMANCE METRICS\n"
+            f"{_REPORT_SECTION_RULE}"
+            f"Total Return: {format_percentage(perf.get('total_return', 0))}\n"
+            f"Daily Return: {format_percentage(perf.get('daily_return', 0))}\n"
+            f"Volatility: {format_percentage(perf.get('volatility', 0))}\n"
+            f"Sharpe Ratio: {perf.get('sharpe_ratio', 0):.2f}\n"
+            f"Max Drawdown: {format_percentage(perf.get('max_drawdown', 0))}\n"
+            "\n"
+        )
     
     # Risk summary
     if 'risk_summary' in data:
         risk = data['risk_summary']
-        report_lines.append("RISK METRICS")
-        report_lines.append("-" * 20)
-        report_lines.append(f"Portfolio Beta: {risk.get('portfolio_beta', 0):.3f}")
-        report_lines.append(f"VaR (95%): {format_currency(risk.get('var_95', 0))}")
-        report_lines.append(f"Tracking Error: {risk.get('tracking_error', 0):.3f}")
-        report_lines.append(f"Concentration Risk: {format_percentage(risk.get('concentration_risk', 0))}")
-        report_lines.append("")
+        write(
+            "RISK METRICS\n"
+            f"{_REPORT_SECTION_RULE}"
+            f"Portfolio Beta: {risk.get('portfolio_beta', 0):.3f}\n"
+            f"VaR (95%): {format_currency(risk.get('var_95', 0))}\n"
+            f"Tracking Error: {risk.get('tracking_error', 0):.3f}\n"
+            f"Concentration Risk: {format_percentage(risk.get('concentration_risk', 0))}\n"
+            "\n"
+        )
     
     # Top holdings
     if 'holdings_data' in data:
@@ -517,14 +584,15 @@ def export_portfolio_report(data: Dict[str, Any]) -> str:
         top_holdings = holdings.get('top_holdings', [])[:10]
         
         if top_holdings:
-            report_lines.append("TOP 10 HOLDINGS")
-            report_lines.append("-" * 20)
-            for i, holding in enumerate(top_holdings, 1):
-                report_lines.append(
-                    f"{i:2d}. {holding.get('Asset_Name', 'Unknown'):<30} "
-                    f"{format_percentage(holding.get('Weight_Percent', 0)):>8} "
-                    f"{format_currency(holding.get('Market_Value', 0)):>12}"
-                )
-            report_lines.append("")
-    
-    return "\n".join(report_lines)
\ No newline at end of file
+            write(f"TOP 10 HOLDINGS\n{_REPORT_SECTION_RULE}")
+            # Formatted column by column, then laid out by one bound row format
+            names = [holding.get('Asset_Name', 'Unknown') for holding in top_holdings]
+            weights = [format_percentage(holding.get('Weight_Percent', 0)) for holding in top_holdings]
+            market_values = format_currency_array([holding.get('Market_Value', 0) for holding in top_holdings])
+            write("".join(map(
+                _REPORT_HOLDING_LINE_FMT, range(1, len(top_holdings) + 1), names, weights, market_values
+            )))
+            write("\n")
+    
+    # The old line list was joined with "\n", so drop the last line's terminator to match
+    return buf.getvalue()[:-1]
\ No newline at end of file